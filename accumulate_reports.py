@@ -4,84 +4,292 @@ and put that data in a file named after the directory the data was
 found in.
 """
 # Standard library imports
+import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 # Third party imports
 import pandas as pd
 
 # Import from our app
+from instrument import instrument
 from logger import Logger
+import peak_store
+from manifest import load_manifest, report_entry, save_manifest
+from report02 import COLUMNS, REPORT_FILENAME, read_report02
+from storage import (check_storage_format, processed_filename, read_table,
+                     typed_peaks, write_table)
 import config
 
 
-# Create an object to log errors that occur
-logger = Logger("", "log.txt", erase_on_init=True)
-
-# RawInput is the folder to put all of the raw data into. RIF stands
-# for raw input folder
-# RIF = "RawInput"
-RIF = config.RAW_INPUT_FOLDER
-if not os.path.exists(RIF):
-    raise OSError("RawInput folder not found. Please ensure it exists in your path and is named correctly.")
-
-# Define a folder for where all processed data should go. PIF stands
-# for processed input folder.
-PIF = config.PROCESSED_INPUT_FOLDER
-if not os.path.exists(PIF):
-    print(f"{PIF} directory did not exist: Created {PIF}.")
-    os.mkdir(PIF)
-
-# Get a list of all the raw data folders. Parse non-folders by excluding
-# anything with a file extension.
-raw_data_folders = [folder for folder in os.listdir(RIF)
-                    if len(folder.split(".")) == 1]
-folder_counter = 1
-for folder_name in raw_data_folders:
-    print(f"Starting folder {folder_counter}/{len(raw_data_folders)} {folder_name}")
+def accumulate_folder(raw_input_folder, folder_name, verbose=True,
+                      known_reports=None, processed_input_folder=None,
+                      storage_format="csv"):
+    """Return a DataFrame of the file name, peak number, retention time,
+    and area from every .D directory in a raw data folder.
+
+    known_reports maps the folder's report file names to their manifest
+    entries from the last run. Reports that haven't changed since then
+    aren't read again, their rows are copied from the folder's existing
+    acc_ file in processed_input_folder, stored in storage_format,
+    instead.
+
+    Also return the manifest entries for the folder's reports, a list of
+    the non-fatal error messages that should be logged, and whether the
+    folder's rows changed since the last run.
+    """
     # Get all of the folders which have relevant Report01.csv files,
     # sorted alphanumerically.
-    filenames = sorted([fn for fn in os.listdir(f"{RIF}/{folder_name}") if fn[-2:] == ".D"])
+    filenames = sorted([fn for fn in os.listdir(f"{raw_input_folder}/{folder_name}") if fn[-2:] == ".D"])
+
+    # csv files keep each value exactly as it was written in the report,
+    # the other formats store the peaks as numbers, so read them as
+    # numbers straight away.
+    as_text = storage_format == "csv"
+
+    # Get the rows saved by the last run. Without them every report has
+    # to be read again. A folder the last run didn't see at all has
+    # changed, even if it has no reports.
+    first_run = known_reports is None
+    if known_reports is None:
+        known_reports = {}
+    old_rows = {}
+    acc_path = f"{processed_input_folder}/{processed_filename(folder_name, storage_format)}"
+    if known_reports and os.path.exists(acc_path):
+        with instrument.stage("load saved rows", item=acc_path) as stage:
+            old_df = read_table(acc_path, storage_format, as_text=as_text)
+            old_rows = {fn: fn_df for fn, fn_df in old_df.groupby("FileName", sort=False)}
+            stage.rows = len(old_df.index)
+    else:
+        known_reports = {}
 
-    # Make a DataFrame to store all of the Report01 files found within
-    # a directory's sub-directories.
-    folder_df = pd.DataFrame(columns=["FileName", "PeakNum", "RetTime", "Area"])
+    # Build the columns as plain lists and turn them into a DataFrame
+    # once at the end, growing a DataFrame row by row is very slow.
+    columns = {column: [] for column in COLUMNS}
+    entries = {}
+    # Worker processes can't share the logger, so collect the messages
+    # and let the caller log them.
+    messages = []
+    changed = False
 
-    print(f"\t~Processing raw data files ({len(filenames)}):")
+    if verbose:
+        print(f"\t~Processing raw data files ({len(filenames)}):")
     file_counter = 1
     for filename in filenames:
-        print(f"\t\t-> {file_counter}/{len(filenames)} {filename}")
+        if verbose:
+            print(f"\t\t-> {file_counter}/{len(filenames)} {filename}")
+        report_path = f"{raw_input_folder}/{folder_name}/{filename}/{REPORT_FILENAME}"
         # Catch error thrown if no report file is found
         try:
-            # Get the contents of the old file
-            with open(f"{RIF}/{folder_name}/{filename}/REPORT02.csv", "r", encoding="utf-16") as file:
-                # Read lines then close to save memory
-                lines = file.readlines()
-
-            # Store the file name, peak number, retention time, and
-            # area in each line of the .csv file as a row in the
-            # dataframe.
-            for line in lines:
-                # Get relevant data from the line, exclude
-                # irrelevant data with _
-                peak_num, ret_time, _, _, area, *_ = line.split(",")
-                # Add as the last row in folder_df
-                folder_df.loc[len(folder_df.index)] = (filename, peak_num, ret_time, area)
-            # Increment file counter
-            file_counter += 1
-                
+            with instrument.stage("check manifest", item=report_path):
+                entry = report_entry(report_path, known_reports.get(filename))
+            if (filename in known_reports
+                and entry["sha256"] == known_reports[filename]["sha256"]):
+                # Unchanged since the last run, reuse the saved rows
+                fn_df = old_rows.get(filename, pd.DataFrame(columns=COLUMNS))
+                peak_nums = fn_df["PeakNum"].tolist()
+                ret_times = fn_df["RetTime"].tolist()
+                areas = fn_df["Area"].tolist()
+            else:
+                # Timed as a decode and a parse stage by read_report02()
+                peak_nums, ret_times, areas = read_report02(report_path, as_text)
+                changed = True
         except FileNotFoundError:
             # This is a non-fatal error, log it and skip this file
-            logger.log(f"There was no report file for {RIF}/{folder_name}/{filename}.")
-            # Increment file counter
-            file_counter += 1
-            continue  # skip to next in filenames
+            messages.append(f"There was no report file for {raw_input_folder}/{folder_name}/{filename}.")
+        except ValueError as e:
+            # Also non-fatal, log it and skip this file
+            messages.append(f"Could not read the report file for {raw_input_folder}/{folder_name}/{filename}: {e}")
+        else:
+            entries[filename] = entry
+            # Store the file name, peak number, retention time, and
+            # area of each line as a row.
+            columns["FileName"].extend([filename] * len(peak_nums))
+            columns["PeakNum"].extend(peak_nums)
+            columns["RetTime"].extend(ret_times)
+            columns["Area"].extend(areas)
+
+        # Increment file counter
+        file_counter += 1
 
-    # Save the folder's DataFrame if it is not empty.
+    # The folder has also changed if a report was added or removed
+    changed = changed or first_run or set(entries) != set(known_reports)
+
+    # Make a DataFrame of all the Report01 files found within a
+    # directory's sub-directories.
+    folder_df = pd.DataFrame(columns)
+    return folder_df, entries, messages, changed
+
+
+def accumulate_folder_task(raw_input_folder, folder_name, verbose=True,
+                           known_reports=None, processed_input_folder=None,
+                           storage_format="csv"):
+    """Run accumulate_folder() as one timed stage. Return its results
+    along with the stages recorded while it ran, which worker processes
+    hand back to the main process.
+    """
+    with instrument.stage("accumulate folder", item=folder_name) as stage:
+        result = accumulate_folder(raw_input_folder, folder_name, verbose,
+                                   known_reports, processed_input_folder,
+                                   storage_format)
+        stage.rows = len(result[0].index)
+    return result, instrument.take_stages()
+
+
+def save_folder(folder_df, processed_input_folder, folder_name, storage_format="csv"):
+    """Save a folder's DataFrame in storage_format if it is not empty.
+    If it is, delete the folder's acc_ file from an earlier run instead,
+    so its old rows aren't read again. Return whether it was saved.
+    """
+    acc_path = f"{processed_input_folder}/{processed_filename(folder_name, storage_format)}"
     if len(folder_df.values) > 0:
-        folder_df.to_csv(f"{PIF}/acc_{folder_name}.csv", index=False, index_label=False)
+        with instrument.stage("save folder", item=folder_name, rows=len(folder_df.index)):
+            if storage_format != "csv":
+                # Store the peak columns as numbers instead of text
+                folder_df = typed_peaks(folder_df)
+            write_table(folder_df, acc_path, storage_format)
         print("\t~Processed and saved")
+        return True
     else:
+        if os.path.exists(acc_path):
+            os.remove(acc_path)
         print("\t~Folder was empty")
-    
-    # Update the folder counter
-    folder_counter += 1
+        return False
+
+
+def accumulate_reports(raw_input_folder, processed_input_folder, manifest_file=None,
+                       workers=1, full=False, logger=None, storage_format="csv",
+                       peak_database=None):
+    """Accumulate the REPORT02.csv files in every raw data folder in
+    raw_input_folder into an acc_<folder> file in processed_input_folder,
+    stored in storage_format. Return the names of the folders saved.
+
+    If manifest_file is given, reports that haven't changed since the
+    run that wrote it are skipped, unless full is True. Folders are read
+    by up to workers processes at once. Errors are logged to logger, or to
+    log.txt if there isn't one.
+
+    If peak_database is given, the peaks of every changed folder are also
+    loaded into that SQLite file, see peak_store.py.
+    """
+    check_storage_format(storage_format)
+    # Log to log.txt unless the caller has a logger
+    own_logger = logger is None
+    if own_logger:
+        logger = Logger("", "log.txt")
+
+    # RawInput is the folder to put all of the raw data into. RIF stands
+    # for raw input folder
+    RIF = raw_input_folder
+    if not os.path.exists(RIF):
+        raise OSError("RawInput folder not found. Please ensure it exists in your path and is named correctly.")
+
+    # Define a folder for where all processed data should go. PIF stands
+    # for processed input folder.
+    PIF = processed_input_folder
+    if not os.path.exists(PIF):
+        print(f"{PIF} directory did not exist: Created {PIF}.")
+        os.mkdir(PIF)
+
+    # Get the reports read by the last run, unless everything should be
+    # read again.
+    if full or manifest_file is None:
+        known_folders = {}
+    else:
+        known_folders = load_manifest(manifest_file)["folders"]
+
+    # Get a list of all the raw data folders. Parse non-folders by excluding
+    # anything with a file extension.
+    raw_data_folders = [folder for folder in os.listdir(RIF)
+                        if len(folder.split(".")) == 1]
+    known_reports = [known_folders.get(folder_name) for folder_name in raw_data_folders]
+
+    if workers > 1:
+        # Read the folders in worker processes. map() hands the results
+        # back in folder order, so the log and the saved files match a
+        # serial run.
+        print(f"Processing {len(raw_data_folders)} folders with {workers} workers")
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(accumulate_folder_task,
+                               [RIF] * len(raw_data_folders),
+                               raw_data_folders,
+                               [False] * len(raw_data_folders),
+                               known_reports,
+                               [PIF] * len(raw_data_folders),
+                               [storage_format] * len(raw_data_folders))
+    else:
+        executor = None
+        results = (accumulate_folder_task(RIF, folder_name, True, folder_reports, PIF, storage_format)
+                   for folder_name, folder_reports in zip(raw_data_folders, known_reports))
+
+    # Folders already in the peak database only need storing again if
+    # they changed
+    if peak_database is not None:
+        conn = peak_store.connect(peak_database)
+        known_db_folders = peak_store.stored_folders(conn)
+    else:
+        conn = None
+
+    manifest = {"folders": {}}
+    saved_folders = []
+    folder_counter = 1
+    # Stop the workers and close the database even if a folder fails,
+    # instead of leaving them running
+    try:
+        for folder_name, (result, stages) in zip(raw_data_folders, results):
+            folder_df, entries, messages, changed = result
+            instrument.merge(stages)
+            print(f"Finished folder {folder_counter}/{len(raw_data_folders)} {folder_name}")
+            for msg in messages:
+                logger.log(msg)
+            if changed:
+                if save_folder(folder_df, PIF, folder_name, storage_format):
+                    saved_folders.append(folder_name)
+            else:
+                print("\t~Unchanged since the last run")
+            if conn is not None and (changed or folder_name not in known_db_folders):
+                with instrument.stage("store peaks", item=folder_name, rows=len(folder_df.index)):
+                    peak_store.store_folder(conn, folder_name, folder_df)
+            manifest["folders"][folder_name] = entries
+
+            # Update the folder counter
+            folder_counter += 1
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if conn is not None:
+            conn.close()
+    # Remember which reports have been read for the next run
+    if manifest_file is not None:
+        save_manifest(manifest, manifest_file)
+    if own_logger:
+        logger.close()
+    return saved_folders
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Accumulate the REPORT02.csv files in each raw data folder.")
+    parser.add_argument("--full", action="store_true",
+                        help="re-read every report, even if it hasn't changed since the last run")
+    args = parser.parse_args()
+
+    instrument.start()
+    # Create an object to log errors that occur
+    logger = Logger("", "log.txt", erase_on_init=True, json_lines=config.LOG_JSON_LINES)
+    accumulate_reports(config.RAW_INPUT_FOLDER,
+                       config.PROCESSED_INPUT_FOLDER,
+                       manifest_file=config.MANIFEST_FILE,
+                       workers=config.ACCUMULATE_WORKERS,
+                       full=args.full,
+                       logger=logger,
+                       storage_format=config.STORAGE_FORMAT,
+                       peak_database=config.PEAK_DATABASE)
+    logger.close()
+    instrument.finish()
+    return
+
+
+# Guard the script so worker processes can import this module without
+# re-running it.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Line up the retention times of different raw data folders before
+their peaks are matched to chemicals, so column drift between batches
+doesn't push peaks out of their chemical's range.
+
+Every folder has standard runs, listed in the super meta data under an
+anchor accession like Rutin_Standard. The retention time of the largest
+peak in those runs is the folder's anchor, and every peak in the folder
+is shifted by however far its anchor is from the reference retention
+time. The anchors are cached in a json file of the form
+    {"folders": {folder_name: {"key": key, "anchor": ret_time}, ...}}
+so they are only found again when the reports of a folder's standard
+runs change, going by the manifest accumulate_reports.py keeps.
+"""
+# Standard library imports
+import hashlib
+import json
+import os
+
+# Third party imports
+import pandas as pd
+import numpy as np
+
+# Import from our app
+from manifest import load_manifest
+import config
+
+
+def load_alignment(path):
+    """Return the anchors cached at path, or an empty cache if there
+    isn't one yet.
+    """
+    if path is None:
+        return {"folders": {}}
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"folders": {}}
+
+
+def save_alignment(alignment, path):
+    """Save the cached anchors to path, through a temporary file."""
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(alignment, file, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+    return
+
+
+def anchor_runs(meta_index, meta_columns, accession):
+    """Return a set of the (FolderName, HPLCdatafilename) pairs of every
+    run of an accession in the indexed super meta data.
+    """
+    column = meta_columns.index("AccessionName")
+    return {key for key, row in meta_index.items() if row[column] == accession}
+
+
+def manifest_reports(manifest):
+    """Return a dict mapping each parent directory in a manifest to its
+    reports' manifest entries, by file name. Folders with and without
+    New in their name share a parent directory, like their acc_ files.
+    """
+    reports = {}
+    for folder_name, entries in manifest.get("folders", {}).items():
+        reports.setdefault(folder_name.replace("New", ""), {}).update(entries)
+    return reports
+
+
+def anchor_key(filenames, folder_reports, reference, max_shift):
+    """Return a key that changes whenever a folder's anchor could: when
+    the reports of its standard runs, named filenames, or the alignment
+    settings change. folder_reports are the folder's manifest entries
+    from manifest_reports(). Return None if a standard run isn't in the
+    manifest, so its anchor is always fitted again.
+    """
+    if any(filename not in folder_reports for filename in filenames):
+        return None
+    sha256s = [(filename, folder_reports[filename]["sha256"]) for filename in sorted(filenames)]
+    return hashlib.sha256(repr((reference, max_shift, sha256s)).encode()).hexdigest()
+
+
+def fit_anchors(anchor_df, reference=None, max_shift=None):
+    """Return a dict mapping each folder to the retention time of its
+    anchor peak: the largest peak in each of its standard runs, taking
+    the median if there are several runs. If reference is given, only
+    peaks within max_shift of it are considered.
+    """
+    if reference is not None and max_shift is not None:
+        anchor_df = anchor_df[(anchor_df["RetTime"] - reference).abs() <= max_shift]
+    # idxmax() can't pick a peak from a run whose areas are all NaN
+    anchor_df = anchor_df.dropna(subset=["Area"])
+    if len(anchor_df.index) == 0:
+        return {}
+    largest = anchor_df.loc[anchor_df.groupby(["ParentDirectory", "FileName"], sort=False)["Area"].idxmax()]
+    return largest.groupby("ParentDirectory", sort=False)["RetTime"].median().to_dict()
+
+
+def estimate_shifts(peaks_df, runs, alignment, logger, reports=None, reference=None, max_shift=None):
+    """Return a dict mapping each folder in peaks_df to how far its
+    retention times should be shifted, in minutes. runs is the set of
+    standard runs from anchor_runs(). Anchors found in alignment are
+    reused if the reports of the folder's standard runs haven't changed
+    according to reports, from manifest_reports(), and new ones are
+    added to it.
+
+    If reference is None, anchors are lined up with the median anchor of
+    all folders. Folders without an anchor, or whose anchor is more than
+    max_shift from the reference, aren't shifted and are logged.
+    """
+    if reports is None:
+        reports = {}
+    sample_keys = list(zip(peaks_df["ParentDirectory"].values, peaks_df["FileName"].values))
+    is_anchor = np.fromiter((key in runs for key in sample_keys), dtype=bool, count=len(sample_keys))
+    anchor_df = peaks_df.loc[is_anchor, ["ParentDirectory", "FileName", "RetTime", "Area"]]
+
+    # Only fit the folders whose standard runs changed since they were
+    # cached, going by their reports in the manifest
+    anchors = {}
+    stale = []
+    folders = alignment.setdefault("folders", {})
+    anchor_files = anchor_df[["ParentDirectory", "FileName"]].drop_duplicates()
+    for folder, folder_files in anchor_files.groupby("ParentDirectory", sort=False):
+        key = anchor_key(folder_files["FileName"].tolist(), reports.get(folder, {}), reference, max_shift)
+        cached = folders.get(folder)
+        if key is not None and cached is not None and cached["key"] == key:
+            anchors[folder] = cached["anchor"]
+        else:
+            stale.append(folder)
+            folders[folder] = {"key": key, "anchor": None}
+    if stale:
+        fitted = fit_anchors(anchor_df[anchor_df["ParentDirectory"].isin(stale)], reference, max_shift)
+        for folder in stale:
+            anchors[folder] = fitted.get(folder)
+            folders[folder]["anchor"] = anchors[folder]
+
+    found = [anchor for anchor in anchors.values() if anchor is not None]
+    if reference is None and found:
+        reference = float(np.median(found))
+
+    shifts = {}
+    for folder in pd.unique(peaks_df["ParentDirectory"].values):
+        anchor = anchors.get(folder)
+        if anchor is None:
+            logger.log(f"{folder} has no standard run to align it by. Its retention times were not shifted.")
+            shifts[folder] = 0.0
+        elif max_shift is not None and abs(reference - anchor) > max_shift:
+            logger.log(f"{folder} would be shifted by {reference - anchor:.3f} minutes, more than the maximum of {max_shift}. Its retention times were not shifted.")
+            shifts[folder] = 0.0
+        else:
+            shifts[folder] = reference - anchor
+    return shifts
+
+
+def apply_shifts(peaks_df, shifts):
+    """Return the retention times in peaks_df with each folder's shift
+    added.
+    """
+    folder_shifts = peaks_df["ParentDirectory"].map(shifts).fillna(0.0).to_numpy(dtype=float)
+    return peaks_df["RetTime"].to_numpy(dtype=float) + folder_shifts
+
+
+def align_peaks(peaks_df, meta_index, meta_columns, logger, alignment_file=None,
+                manifest_file=None,
+                accession=config.ALIGN_ANCHOR_ACCESSION,
+                reference=config.ALIGN_REFERENCE_RET_TIME,
+                max_shift=config.ALIGN_MAX_SHIFT):
+    """Return the retention times in peaks_df lined up by the standard
+    runs of accession, see estimate_shifts(). Anchors are cached in
+    alignment_file, if given, and reused while the standard runs'
+    reports in manifest_file stay the same.
+    """
+    runs = anchor_runs(meta_index, meta_columns, accession)
+    alignment = load_alignment(alignment_file)
+    reports = manifest_reports(load_manifest(manifest_file)) if manifest_file is not None else {}
+    shifts = estimate_shifts(peaks_df, runs, alignment, logger, reports, reference, max_shift)
+    if alignment_file is not None:
+        save_alignment(alignment, alignment_file)
+    for folder, shift in shifts.items():
+        if shift != 0:
+            print(f"\t~Shifting {folder} by {shift:+.3f} minutes")
+    return apply_shifts(peaks_df, shifts)
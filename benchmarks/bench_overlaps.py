@@ -0,0 +1,75 @@
+"""Compare the old nested-loop overlap search of generate_chemmeta.py
+with the sweep-line find_overlaps() at growing numbers of ranges.
+
+Run from the repository root:
+    python benchmarks/bench_overlaps.py
+"""
+# Standard library imports
+import os
+import random
+import sys
+import time
+
+# Import from our app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chem_ranges import find_overlaps
+
+# The nested loops take minutes past this many ranges
+MAX_LEGACY_RANGES = 2000
+
+
+def make_ranges(n):
+    """Return n random cardenolide and phenylpropanoid ranges, each
+    class made of non-overlapping ranges like group_peaks() gives.
+    """
+    ranges = []
+    for prefix in ["C", "PP"]:
+        start = 0.0
+        for _ in range(n // 2):
+            start += random.uniform(0.15, 0.6)
+            end = start + random.uniform(0.2, 1.3)
+            ranges.append((start, end, f"{prefix}{round((start + end) / 2, 1)}_Area"))
+            start = end
+    return ranges
+
+
+def legacy_find_overlaps(ranges):
+    """The original search, which re-parsed the chemmeta lines while
+    comparing every range with every other range.
+    """
+    lines = [f"{begin},{end},{chem_id}\n" for begin, end, chem_id in ranges]
+    hits = set()
+    for line in lines:
+        begin, end, chem_id = line.split(",")
+        begin = float(begin)
+        end = float(end)
+        for line in lines:
+            begin2, end2, chem_id2 = line.split(",")
+            if chem_id == chem_id2:
+                continue
+            begin2 = float(begin2)
+            end2 = float(end2)
+            if ((begin >= float(begin2) and begin <= float(end2))
+                or (end >= float(begin2) and end <= float(end2))):
+                hits.add(tuple(sorted((chem_id[:-1], chem_id2[:-1]))))
+    return hits
+
+
+def time_call(func, *args):
+    """Return the result of func and how long it took in seconds."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    random.seed(0)
+    for n in [500, 2000, 10000, 50000]:
+        ranges = make_ranges(n)
+        hits, after = time_call(find_overlaps, ranges)
+        if n <= MAX_LEGACY_RANGES:
+            legacy_hits, before = time_call(legacy_find_overlaps, ranges)
+            assert hits == legacy_hits, "find_overlaps() disagrees with the nested loops"
+            print(f"{n:>6} ranges: before {before:>8.3f}s, after {after:>8.4f}s ({before / after:.0f}x), {len(hits)} overlaps")
+        else:
+            print(f"{n:>6} ranges: before {'-':>8} , after {after:>8.4f}s, {len(hits)} overlaps")
@@ -0,0 +1,67 @@
+"""Compare how many REPORT02.csv rows per second the old row-by-row
+DataFrame appends and the new bulk columnar reader can accumulate.
+
+Run from the repository root:
+    python benchmarks/bench_report02.py
+"""
+# Standard library imports
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Third party imports
+import pandas as pd
+
+# Import from our app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from accumulate_reports import accumulate_folder
+from report02 import COLUMNS, REPORT_FILENAME
+from synthetic import make_compounds, report_lines, write_report
+
+
+def write_folder(path, n_files, n_peaks, rng):
+    """Write a raw data folder of n_files .D directories, each with a
+    REPORT02.csv of n_peaks lines.
+    """
+    compounds = make_compounds(60, rng)
+    for i in range(n_files):
+        os.makedirs(f"{path}/{i:03d}-P1-A{i}.D")
+        write_report(f"{path}/{i:03d}-P1-A{i}.D/{REPORT_FILENAME}", report_lines(n_peaks, compounds, rng))
+    return
+
+
+def legacy_accumulate_folder(raw_input_folder, folder_name):
+    """The original loop, which appended one DataFrame row per line."""
+    filenames = sorted([fn for fn in os.listdir(f"{raw_input_folder}/{folder_name}") if fn[-2:] == ".D"])
+    folder_df = pd.DataFrame(columns=COLUMNS)
+    for filename in filenames:
+        with open(f"{raw_input_folder}/{folder_name}/{filename}/{REPORT_FILENAME}", "r", encoding="utf-16") as file:
+            lines = file.readlines()
+        for line in lines:
+            peak_num, ret_time, _, _, area, *_ = line.split(",")
+            folder_df.loc[len(folder_df.index)] = (filename, peak_num, ret_time, area)
+    return folder_df
+
+
+def rows_per_second(func, *args):
+    """Return the number of rows func made per second of wall time."""
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    # accumulate_folder also returns its log messages
+    if isinstance(result, tuple):
+        result = result[0]
+    return len(result.index) / elapsed
+
+
+if __name__ == "__main__":
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as raw_input_folder:
+        for n_files, n_peaks in [(10, 50), (20, 100), (40, 100)]:
+            folder_name = f"folder_{n_files}_{n_peaks}"
+            write_folder(f"{raw_input_folder}/{folder_name}", n_files, n_peaks, rng)
+            before = rows_per_second(legacy_accumulate_folder, raw_input_folder, folder_name)
+            after = rows_per_second(accumulate_folder, raw_input_folder, folder_name, False)
+            print(f"{n_files * n_peaks:>6} rows: before {before:>10.0f} rows/sec, after {after:>10.0f} rows/sec ({after / before:.1f}x)")
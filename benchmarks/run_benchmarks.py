@@ -0,0 +1,178 @@
+"""Time accumulate_reports, generate_chemmeta, and generate_dataset on
+synthetic data at several scales, and save the results so a later run
+can be compared against them.
+
+Run from the repository root:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --scales small medium --compare benchmarks/results/<earlier run>.json
+"""
+# Standard library imports
+import argparse
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Third party imports
+import pandas as pd
+
+# Import from our app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from accumulate_reports import accumulate_folder
+from chem_ranges import ChemRanges
+from generate_chemmeta import build_chemmeta, load_peaks_txt
+from generate_dataset import (build_dataset, build_dataset_legacy,
+                              index_meta_data, load_processed_peaks)
+from logger import Logger
+from synthetic import generate_raw_input
+
+# (folders, .D directories per folder, peaks per report, peak library
+# size) at each scale
+SCALES = {
+    "small": (5, 20, 30, 2400),
+    "medium": (20, 50, 40, 20000),
+    "large": (50, 100, 50, 100000),
+}
+
+# The legacy dataset engine is too slow to time past this many samples
+MAX_LEGACY_SAMPLES = 1000
+
+# Each benchmark is run this many times and the fastest run is kept,
+# to keep noise from looking like a regression
+REPEATS = 3
+
+# A benchmark is reported as a regression if it got this much slower
+REGRESSION_THRESHOLD = 1.2
+
+
+def timed(func, *args, repeats=REPEATS):
+    """Return the result of func and the fastest of repeats runs of it
+    in seconds.
+    """
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        seconds = time.perf_counter() - start
+        if best is None or seconds < best:
+            best = seconds
+    return result, best
+
+
+def run_scale(scale, root):
+    """Run every benchmark on a fresh synthetic tree. Return a list of
+    result dicts.
+    """
+    raw_input_folder, super_meta_file, card_txt, pp_txt = generate_raw_input(root, *SCALES[scale])
+    processed_input_folder = f"{root}/ProcessedInput"
+    os.mkdir(processed_input_folder)
+    logger = Logger(root, "log.txt", erase_on_init=True)
+    results = []
+
+    def record(name, seconds, rows):
+        results.append({"scale": scale, "benchmark": name, "seconds": seconds,
+                        "rows": rows, "rows_per_sec": rows / seconds if seconds > 0 else None})
+        print(f"{scale:<8}{name:<28}{seconds:>10.3f}s{rows:>10} rows")
+        return
+
+    # accumulate_reports: read every folder's reports
+    def accumulate_all():
+        n_rows = 0
+        for folder_name in sorted(os.listdir(raw_input_folder)):
+            folder_df = accumulate_folder(raw_input_folder, folder_name, False)[0]
+            folder_df.to_csv(f"{processed_input_folder}/acc_{folder_name}.csv", index=False)
+            n_rows += len(folder_df.index)
+        return n_rows
+    n_rows, seconds = timed(accumulate_all)
+    record("accumulate_reports", seconds, n_rows)
+
+    # generate_chemmeta: bucket the peak libraries and resolve overlaps
+    card_peaks = load_peaks_txt(card_txt)
+    pp_peaks = load_peaks_txt(pp_txt)
+    for delete_ambig in [True, False]:
+        chemmeta_df, seconds = timed(build_chemmeta, card_peaks, pp_peaks, 0.1, 0.2, 1.3, delete_ambig, False)
+        record(f"generate_chemmeta Ambig{not delete_ambig}", seconds, len(card_peaks) + len(pp_peaks))
+
+    # generate_dataset: turn the processed peaks into the final dataset
+    chemmeta_df = chemmeta_df.reset_index()
+    chem_ranges = ChemRanges(chemmeta_df)
+    chem_columns = sorted(set(chemmeta_df["ChemicalID"]))
+    meta_df = pd.read_csv(super_meta_file).sort_values(by=["HPLCdatafilename"], kind="stable")
+    meta_columns = list(meta_df.columns)
+    meta_index = index_meta_data(meta_df, logger)
+    processed_filenames = sorted(os.listdir(processed_input_folder))
+
+    def build_all():
+        peaks_df = load_processed_peaks(processed_input_folder, processed_filenames)
+        output_df = build_dataset(peaks_df, chem_ranges, chem_columns, meta_index, meta_columns, logger)
+        return peaks_df, output_df
+    (peaks_df, output_df), seconds = timed(build_all)
+    record("generate_dataset", seconds, len(peaks_df.index))
+
+    if len(output_df.index) <= MAX_LEGACY_SAMPLES:
+        # The legacy engine prints a line per sample, so keep it quiet
+        with open(os.devnull, "w") as devnull:
+            stdout = sys.stdout
+            sys.stdout = devnull
+            try:
+                _, seconds = timed(build_dataset_legacy, processed_input_folder, processed_filenames,
+                                   chem_ranges, chem_columns, meta_index, meta_columns, logger,
+                                   repeats=1)
+            finally:
+                sys.stdout = stdout
+        record("generate_dataset legacy", seconds, len(peaks_df.index))
+    logger.close()
+    return results
+
+
+def compare(results, baseline_path):
+    """Print how each result changed since the baseline results, and
+    return the number of regressions.
+    """
+    with open(baseline_path, "r") as file:
+        baseline = {(r["scale"], r["benchmark"]): r for r in json.load(file)["results"]}
+    regressions = 0
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        old = baseline.get((result["scale"], result["benchmark"]))
+        if old is None or old["seconds"] <= 0:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        flag = ""
+        if ratio > REGRESSION_THRESHOLD:
+            flag = "  <-- REGRESSION"
+            regressions += 1
+        print(f"{result['scale']:<8}{result['benchmark']:<28}{ratio:>8.2f}x the time{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic data.")
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=list(SCALES))
+    parser.add_argument("--results-folder", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "results"),
+                        help="folder to save the results in")
+    parser.add_argument("--compare", default=None,
+                        help="an earlier results file to check for regressions against")
+    args = parser.parse_args()
+
+    results = []
+    for scale in args.scales:
+        with tempfile.TemporaryDirectory() as root:
+            results.extend(run_scale(scale, root))
+
+    os.makedirs(args.results_folder, exist_ok=True)
+    now_str = datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
+    results_path = f"{args.results_folder}/benchmark{now_str}.json"
+    with open(results_path, "w") as file:
+        json.dump({"time": now_str, "python": sys.version.split()[0], "results": results}, file, indent=1)
+    print(f"*Saved results to {results_path}*")
+
+    if args.compare is not None and compare(results, args.compare) > 0:
+        sys.exit(1)
+    return
+
+
+if __name__ == "__main__":
+    main()
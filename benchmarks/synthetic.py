@@ -0,0 +1,142 @@
+"""Generate synthetic HPLC data for benchmarks: a RawInput tree of run
+folders and .D directories with UTF-16 REPORT02.csv files, a matching
+supermeta.csv, and card.txt/pp.txt peak libraries. With --signals, every
+.D directory also gets a raw signal export of the peaks in its report.
+
+Run from the repository root to write a tree to disk:
+    python benchmarks/synthetic.py OUTPUT_FOLDER --folders 10 --files 50 --peaks 40
+"""
+# Standard library imports
+import argparse
+import os
+import random
+import sys
+
+# Third party imports
+import numpy as np
+
+# Import from our app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from report02 import REPORT_FILENAME
+import config
+
+
+def make_compounds(n_compounds, rng):
+    """Return the retention times of n_compounds made up compounds,
+    spread over a 30 minute run.
+    """
+    return sorted(rng.uniform(1, 30) for _ in range(n_compounds))
+
+
+def report_lines(n_peaks, compounds, rng):
+    """Return the lines of a REPORT02.csv file with n_peaks peaks. Each
+    line has the columns the instrument writes: peak number, retention
+    time, type, width, area, height, and area percent.
+    """
+    ret_times = sorted(rng.gauss(rng.choice(compounds), 0.05) for _ in range(n_peaks))
+    areas = [rng.uniform(1, 5000) for _ in ret_times]
+    total_area = sum(areas)
+    lines = []
+    for peak_num, (ret_time, area) in enumerate(zip(ret_times, areas), start=1):
+        peak_type = rng.choice(["BB", "BV", "VB", "VV"])
+        width = rng.uniform(0.05, 0.2)
+        height = area / (width * 60)
+        lines.append(f"{peak_num},{ret_time:.3f},{peak_type},{width:.4f},{area:.5f},{height:.5f},{100 * area / total_area:.5f}\n")
+    return lines
+
+
+def write_report(path, lines):
+    """Write a REPORT02.csv file encoded as UTF-16, like the
+    instrument's.
+    """
+    with open(path, "w", encoding="utf-16") as file:
+        file.writelines(lines)
+    return
+
+
+def signal_lines(report, rng, run_minutes=32, spacing=0.4 / 60):
+    """Return the lines of a signal export holding the peaks in the
+    lines of a report: one Gaussian per peak with the report's retention
+    time, width, and area, over a drifting, noisy baseline. Retention
+    times are in minutes and areas in units times seconds.
+    """
+    times = np.arange(0, run_minutes, spacing)
+    values = 2 + 0.1 * times + np.array([rng.gauss(0, 0.05) for _ in times])
+    for line in report:
+        fields = line.split(",")
+        ret_time, width, area = float(fields[1]), float(fields[3]), float(fields[4])
+        # width is the full width at half height
+        sigma = width / 2.355
+        height = area / (sigma * 60 * np.sqrt(2 * np.pi))
+        values += height * np.exp(-0.5 * ((times - ret_time) / sigma) ** 2)
+    return [f"{time:.5f},{value:.5f}\n" for time, value in zip(times, values)]
+
+
+def generate_raw_input(root, n_folders, n_files, n_peaks, n_library_peaks=2400,
+                       n_compounds=60, missing_rate=0.02, seed=0, signals=False):
+    """Write a RawInput folder, supermeta.csv, card.txt, and pp.txt into
+    root. Every folder gets n_files .D directories with n_peaks peaks
+    each. About missing_rate of the .D directories have no report, and
+    about as many samples are left out of the supermeta. The two peak
+    libraries share n_library_peaks peaks. If signals is True, every .D
+    directory also gets a signal export of its report's peaks.
+
+    Return the paths of the raw input folder, supermeta, card.txt, and
+    pp.txt.
+    """
+    rng = random.Random(seed)
+    compounds = make_compounds(n_compounds, rng)
+    raw_input_folder = f"{root}/RawInput"
+    os.makedirs(raw_input_folder, exist_ok=True)
+
+    meta_rows = []
+    for folder_num in range(n_folders):
+        folder_name = f"2022031{folder_num // 100:01d}2022-03-16{folder_num % 100:02d}-15-58"
+        for file_num in range(n_files):
+            filename = f"{file_num + 1:03d}-P{folder_num + 1}-A{file_num % 12 + 1}.D"
+            os.makedirs(f"{raw_input_folder}/{folder_name}/{filename}", exist_ok=True)
+            report = None
+            if rng.random() >= missing_rate:
+                report = report_lines(n_peaks, compounds, rng)
+                write_report(f"{raw_input_folder}/{folder_name}/{filename}/{REPORT_FILENAME}", report)
+            if signals:
+                # Runs without a report still have a signal
+                if report is None:
+                    report = report_lines(n_peaks, compounds, rng)
+                write_report(f"{raw_input_folder}/{folder_name}/{filename}/{config.SIGNAL_FILENAME}",
+                             signal_lines(report, rng))
+            if rng.random() >= missing_rate:
+                accession = "Rutin_Standard" if file_num == 0 else f"A{rng.randint(1, 200)}"
+                meta_rows.append(f"{len(meta_rows) + 1},{folder_name},{filename},{accession},"
+                                 f"{rng.choice(['Drought', 'Control'])},{rng.choice(['Hybrid', 'Syriaca'])}\n")
+
+    super_meta_file = f"{root}/supermeta.csv"
+    with open(super_meta_file, "w") as file:
+        file.write("Sort#,FolderName,HPLCdatafilename,AccessionName,Condition,Species\n")
+        file.writelines(meta_rows)
+
+    # The peak libraries hold the retention times of annotated peaks,
+    # split between cardenolides and phenylpropanoids.
+    card_txt = f"{root}/card.txt"
+    pp_txt = f"{root}/pp.txt"
+    for path, library_compounds in [(card_txt, compounds[0::2]), (pp_txt, compounds[1::2])]:
+        peaks = [rng.gauss(rng.choice(library_compounds), 0.08) for _ in range(n_library_peaks // 2)]
+        with open(path, "w") as file:
+            file.write(",".join(f"{peak:.2f}" for peak in peaks))
+    return raw_input_folder, super_meta_file, card_txt, pp_txt
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write a synthetic RawInput tree.")
+    parser.add_argument("root", help="folder to write the data into")
+    parser.add_argument("--folders", type=int, default=10)
+    parser.add_argument("--files", type=int, default=50)
+    parser.add_argument("--peaks", type=int, default=40)
+    parser.add_argument("--library-peaks", type=int, default=2400)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--signals", action="store_true",
+                        help="also write a raw signal export into every .D directory")
+    args = parser.parse_args()
+    paths = generate_raw_input(args.root, args.folders, args.files, args.peaks,
+                               args.library_peaks, seed=args.seed, signals=args.signals)
+    print("Wrote " + ", ".join(paths))
@@ -0,0 +1,110 @@
+"""Look up which chemical's retention time range a peak falls in, and
+find the ranges that overlap each other.
+"""
+# Standard library imports
+import heapq
+
+# Third party imports
+import numpy as np
+
+
+class ChemRanges:
+    """The retention time ranges of a chemical meta data DataFrame,
+    compiled once so that every peak in a file can be given its
+    ChemicalID in one vectorized call.
+
+    Ranges include both of their ends. If a retention time falls in
+    more than one range, it gets the ChemicalID of whichever range comes
+    first in the chemical meta data, same as a linear scan would.
+    """
+    def __init__(self, chemmeta_df):
+        begins = chemmeta_df["BeginRetTime"].astype(float).to_numpy()
+        ends = chemmeta_df["EndRetTime"].astype(float).to_numpy()
+        chem_ids = chemmeta_df["ChemicalID"].to_numpy(dtype=object)
+
+        # Reversed ranges and ranges missing an end hold no retention
+        # time, leave them out
+        valid = begins <= ends
+        begins = begins[valid]
+        ends = ends[valid]
+        chem_ids = chem_ids[valid]
+
+        # Every range begin and end, sorted. These split the retention
+        # time axis into pieces: the open gap below boundaries[0], the
+        # point boundaries[0], the open gap up to boundaries[1], and so
+        # on, ending with the open gap above the last boundary. Every
+        # retention time within a piece falls in the same ranges, and
+        # boundaries[k] is piece 2 * k + 1.
+        self.boundaries = np.unique(np.concatenate([begins, ends]))
+        n = len(self.boundaries)
+        self.piece_ids = np.full(2 * n + 1, None, dtype=object)
+        if n == 0:
+            return
+        first_pieces = 2 * np.searchsorted(self.boundaries, begins) + 1
+        last_pieces = 2 * np.searchsorted(self.boundaries, ends) + 1
+
+        # Give each range's pieces its ChemicalID, in the order of the
+        # chemical meta data, skipping pieces an earlier range already
+        # has. next_open[p] leads to the first piece at or after p that
+        # has no range yet, so every piece is only given a range once.
+        next_open = list(range(2 * n + 2))
+        for chem_id, first_piece, last_piece in zip(chem_ids, first_pieces.tolist(), last_pieces.tolist()):
+            piece = _find_open(next_open, first_piece)
+            while piece <= last_piece:
+                self.piece_ids[piece] = chem_id
+                next_open[piece] = piece + 1
+                piece = _find_open(next_open, piece + 1)
+        return
+
+    def lookup(self, ret_times):
+        """Return an object array of the ChemicalID for each retention
+        time, or None where a retention time isn't in any range.
+        """
+        ret_times = np.asarray(ret_times, dtype=float)
+        n = len(self.boundaries)
+        if n == 0:
+            return np.full(ret_times.shape, None, dtype=object)
+
+        # Index of the first boundary at or above each retention time.
+        # NaN sorts above every boundary, so it lands in the last gap.
+        i = np.searchsorted(self.boundaries, ret_times, side="left")
+        on_boundary = self.boundaries[np.minimum(i, n - 1)] == ret_times
+        return self.piece_ids[2 * i + on_boundary]
+
+
+def _find_open(next_open, piece):
+    """Return the first piece at or after piece that has no range yet,
+    shortening the path to it for the next search.
+    """
+    root = piece
+    while next_open[root] != root:
+        root = next_open[root]
+    while next_open[piece] != root:
+        next_open[piece], piece = root, next_open[piece]
+    return root
+
+
+def find_overlaps(ranges):
+    """Return a set of the sorted (chem_id, chem_id) pairs of every two
+    ranges that overlap, ends included. ranges is a list of (begin, end,
+    chem_id) tuples. Ranges sharing a chem_id are never paired.
+
+    Sweeps over the ranges in order of where they begin, only comparing
+    each range to the ranges that haven't ended yet.
+    """
+    hits = set()
+    # Heap of (end, index) for the ranges that haven't ended yet
+    active = []
+    for i in sorted(range(len(ranges)), key=lambda i: ranges[i][0]):
+        begin, end, chem_id = ranges[i]
+        # Forget the ranges that ended before this one begins
+        while active and active[0][0] < begin:
+            heapq.heappop(active)
+        # Everything left began at or before this range and ends at or
+        # after its beginning, so it overlaps this range.
+        for _, j in active:
+            other_chem_id = ranges[j][2]
+            if other_chem_id != chem_id:
+                hits.add(tuple(sorted((chem_id, other_chem_id))))
+        heapq.heappush(active, (end, i))
+    return hits
@@ -0,0 +1,92 @@
+"""Keep every chemical meta data file generate_chemmeta.py builds, so the
+same settings never have to be built twice.
+
+Each file is stored in the cache folder under a key hashed from the
+contents of the peak libraries and every setting that changes the
+result, so editing card.txt, pp.txt, or any of the settings gives a new
+entry instead of overwriting an old one. When the cache grows past its
+size cap, the entries used least recently are deleted first.
+"""
+# Standard library imports
+import hashlib
+import json
+import os
+
+# Import from our app
+import config
+
+# Bump this whenever generate_chemmeta.py changes how it builds the
+# chemical meta data, so older cache entries are no longer used
+CHEMMETA_VERSION = 1
+
+
+def chemmeta_key(card_txt, pp_txt, margin, min_range, max_range, delete_ambig):
+    """Return the cache key of the chemical meta data built from the
+    peak libraries card_txt and pp_txt with the given settings.
+    """
+    sha256 = hashlib.sha256()
+    settings = {"version": CHEMMETA_VERSION, "margin": margin, "min_range": min_range,
+                "max_range": max_range, "delete_ambig": delete_ambig}
+    sha256.update(json.dumps(settings, sort_keys=True).encode())
+    for path in [card_txt, pp_txt]:
+        with open(path, "rb") as file:
+            contents = file.read()
+        # Keep where one file ends and the next begins in the hash
+        sha256.update(len(contents).to_bytes(8, "little"))
+        sha256.update(contents)
+    return sha256.hexdigest()
+
+
+def entry_filename(key, margin, min_range, max_range, delete_ambig):
+    """Return the name a cache entry is saved under. The settings are
+    only there to make the folder easier to browse, the key is what
+    tells entries apart.
+    """
+    return f"chemmeta_{margin}_{min_range}_{max_range}_Ambig{not delete_ambig}_{key[:16]}.csv"
+
+
+def evict(cache_folder, max_bytes, keep=None):
+    """Delete the least recently used entries in cache_folder until it
+    holds at most max_bytes, never deleting the entry named keep.
+    """
+    entries = []
+    for filename in os.listdir(cache_folder):
+        if filename.startswith("chemmeta_") and filename.endswith(".csv"):
+            stat = os.stat(f"{cache_folder}/{filename}")
+            entries.append((stat.st_mtime, stat.st_size, filename))
+    total = sum(size for _, size, _ in entries)
+    # Oldest first
+    for _, size, filename in sorted(entries):
+        if total <= max_bytes:
+            break
+        if filename == keep:
+            continue
+        os.remove(f"{cache_folder}/{filename}")
+        total -= size
+    return
+
+
+def cache_lookup(card_txt, pp_txt, margin, min_range, max_range, delete_ambig,
+                 cache_folder=config.CHEMMETA_CACHE_FOLDER):
+    """Return the path in cache_folder of the chemical meta data built
+    from card_txt and pp_txt with the given settings, and whether it is
+    already there. A hit is marked as just used.
+    """
+    if not os.path.exists(cache_folder):
+        print(f"{cache_folder} directory did not exist: Created {cache_folder}.")
+        os.mkdir(cache_folder)
+    key = chemmeta_key(card_txt, pp_txt, margin, min_range, max_range, delete_ambig)
+    path = f"{cache_folder}/{entry_filename(key, margin, min_range, max_range, delete_ambig)}"
+    hit = os.path.exists(path)
+    if hit:
+        os.utime(path)
+    return path, hit
+
+
+def cache_store(built_file, path, max_bytes=config.CHEMMETA_CACHE_MAX_BYTES):
+    """Move a newly built chemical meta data file to its path from
+    cache_lookup(), then evict old entries to stay under max_bytes.
+    """
+    os.replace(built_file, path)
+    evict(os.path.dirname(path), max_bytes, keep=os.path.basename(path))
+    return
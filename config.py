@@ -40,3 +40,123 @@ PROCESSED_INPUT_FOLDER = "ProcessedInput"
 # will be stored. If it doesn't exist, it will be created for you.
 # Do not include a '/' at the end.
 OUTPUT_FOLDER = "Output"
+
+# Number of worker processes accumulate_reports.py uses to read the raw
+# data folders in parallel. Set to 1 to read one folder at a time.
+ACCUMULATE_WORKERS = 1
+
+# The absolute or relative path to the .json file where
+# accumulate_reports.py records the reports it has already read, so
+# that unchanged reports are skipped on the next run. Run
+# accumulate_reports.py with --full to read every report again.
+MANIFEST_FILE = f"{PROCESSED_INPUT_FOLDER}_manifest.json"
+
+# How generate_dataset.py builds the final dataset. "vectorized" reads
+# every processed file and builds the dataset in a few whole-table
+# operations. "legacy" builds it one sample at a time. "sqlite" builds
+# it with one query on PEAK_DATABASE. generate_dataset.py --chem-meta
+# needs "vectorized".
+DATASET_ENGINE = "vectorized"
+
+# Whether log.txt should be written as json lines, one object per
+# message, instead of plain text.
+LOG_JSON_LINES = False
+
+# Whether to time every stage of the pipeline and print a summary of
+# the slowest stages, folders, and files at the end of each script.
+INSTRUMENT = False
+
+# If INSTRUMENT is True and this is a path, also profile each script
+# with cProfile and save the stats to this file for pstats.
+PROFILE_FILE = None
+
+# How the processed acc_ files and the final dataset are stored: "csv",
+# "parquet", or "feather". Parquet and Feather keep the peak columns
+# typed and take less space, but need the pyarrow library.
+STORAGE_FORMAT = "csv"
+
+# The absolute or relative path to a SQLite database file that
+# accumulate_reports.py also loads every peak into, for queries with
+# peak_store.py and the "sqlite" DATASET_ENGINE. Set to None to skip it.
+PEAK_DATABASE = None
+
+# How many seconds watch.py waits between looks at the raw input folder
+WATCH_INTERVAL = 10
+
+# How many seconds a run folder's reports must go unchanged before
+# watch.py treats the folder as completely copied and accumulates it
+WATCH_SETTLE_SECONDS = 60
+
+# Name of the raw signal export peak_calling.py reads from each .D
+# directory: a csv file of retention time (minutes) and absorbance pairs.
+SIGNAL_FILENAME = "SIGNAL01.csv"
+
+# The absolute or relative path to the directory where peak_calling.py
+# saves the peaks it calls, one acc_ file per raw data folder. Point
+# generate_dataset.py at it to build a dataset from them.
+# Do not include a '/' at the end.
+CALLED_INPUT_FOLDER = "CalledInput"
+
+# Number of worker processes peak_calling.py calls runs with. Set to
+# None to use one per CPU.
+PEAK_CALLING_WORKERS = None
+
+# Number of points averaged to smooth a signal before finding peaks
+PEAK_SMOOTH_WIDTH = 5
+
+# Width in minutes of the widest peak the baseline should cut out.
+# Anything wider is treated as baseline drift.
+PEAK_BASELINE_WINDOW = 1.0
+
+# Smallest peak height, above the baseline, that peak_calling.py keeps.
+# In the signal's units, usually mAU.
+PEAK_MIN_HEIGHT = 1.0
+
+# Whether generate_dataset.py shifts each folder's retention times to
+# line up its standard runs with the other folders' before matching
+# peaks to chemicals, to undo column drift between batches. Only the
+# "vectorized" DATASET_ENGINE aligns retention times.
+ALIGN_RET_TIMES = False
+
+# AccessionName, in the super meta data, of the standard runs whose
+# largest peak anchors each folder's alignment
+ALIGN_ANCHOR_ACCESSION = "Rutin_Standard"
+
+# Retention time, in minutes, every folder's anchor peak is moved to.
+# Set to None to line the folders up with their median anchor instead.
+ALIGN_REFERENCE_RET_TIME = None
+
+# Largest shift, in minutes, applied to a folder. Folders that would
+# need more are left as they are and logged.
+ALIGN_MAX_SHIFT = 0.5
+
+# The absolute or relative path to the .json file where each folder's
+# anchor is cached, so it is only found again when its standard runs
+# change.
+ALIGNMENT_FILE = f"{PROCESSED_INPUT_FOLDER}_alignment.json"
+
+# The absolute or relative path to the directory where every chemical
+# meta data file generate_chemmeta.py builds is kept, keyed by the peak
+# libraries and settings it was built from. If it doesn't exist, it will
+# be created for you. Do not include a '/' at the end.
+CHEMMETA_CACHE_FOLDER = "ChemmetaCache"
+
+# Largest size, in bytes, of CHEMMETA_CACHE_FOLDER. The files used least
+# recently are deleted once it grows past this.
+CHEMMETA_CACHE_MAX_BYTES = 50 * 1024 * 1024
+
+# Whether generate_dataset.py should use the cached chemical meta data
+# for CARD_TXT, PP_TXT, and the settings above, building it first if it
+# isn't cached yet, instead of reading CHEM_META_FILE.
+CHEM_META_FROM_CACHE = False
+
+# How many samples at a time generate_dataset.py's "vectorized" engine
+# spreads out into the wide final dataset and writes, so the whole table
+# is never held in memory. Set to None to build it all at once. Only csv
+# datasets are written in chunks.
+DATASET_CHUNK_SIZE = 1000
+
+# Type the final dataset's areas are stored as. "float32" halves their
+# memory, but keeps only about 7 significant digits, so large areas are
+# rounded.
+DATASET_AREA_DTYPE = "float64"
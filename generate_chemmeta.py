@@ -1,40 +1,66 @@
-from math import sqrt
+from array import array
+from math import inf, sqrt
 import re
+import shutil
 
+import numpy as np
 import pandas as pd
 
+from chem_ranges import find_overlaps
+from chemmeta_cache import cache_lookup, cache_store
+from instrument import instrument
 import config
 
 
 class Bucket:
-    def __init__(self, peaks=[]):
-        self.peaks = peaks
+    """A group of peak retention times.
+
+    Running totals are updated as each peak is added, so the mean,
+    standard deviation, min, and max never need to go back over the
+    peaks. The variance uses Welford's method, the mean divides a
+    running sum so it matches sum(peaks) / len(peaks).
+    """
+    __slots__ = ("peaks", "_total", "_welford_mean", "_m2", "_min", "_max")
+
+    def __init__(self, peaks=None):
+        self.peaks = array("d")
+        self._total = 0.0
+        self._welford_mean = 0.0
+        self._m2 = 0.0
+        self._min = inf
+        self._max = -inf
+        if peaks is not None:
+            for peak in peaks:
+                self.add_peak(peak)
         return
 
     @property
     def mean(self):
         """Return the mean for self.peaks."""
-        return sum(self.peaks) / len(self.peaks)
+        return self._total / len(self.peaks)
 
     @property
     def std(self):
         """Calculate the population standard deviation for self.peaks."""
-        u = self.mean
-        N = len(self.peaks)
-        std = sqrt(sum([(x - u) ** 2 for x in self.peaks]) / N)
-        return std
+        return sqrt(self._m2 / len(self.peaks))
 
     @property
     def min(self):
-        return min(self.peaks)
+        return self._min
 
     @property
     def max(self):
-        return max(self.peaks)
+        return self._max
 
     def add_peak(self, peak):
         """Add a peak to the population."""
         self.peaks.append(peak)
+        self._total += peak
+        delta = peak - self._welford_mean
+        self._welford_mean += delta / len(self.peaks)
+        self._m2 += delta * (peak - self._welford_mean)
+        self._min = min(self._min, peak)
+        self._max = max(self._max, peak)
         return
 
     def info(self):
@@ -56,12 +82,19 @@ class Bucket:
         peak in this bucket, return an empty list.
         """
         if len(self.peaks) > 1:
-            return [p for p in self.peaks if self.is_outlier(p)]
+            # Check every peak at once
+            peaks = np.array(self.peaks)
+            lower_bound = self.mean - 3 * self.std
+            upper_bound = self.mean + 3 * self.std
+            return peaks[(peaks <= lower_bound) | (peaks >= upper_bound)].tolist()
         else:
             return []  # self.std is 0 if there is one peak
 
     def __getitem__(self, i):
         return self.peaks[i]
+
+    def __len__(self):
+        return len(self.peaks)
     
 
 def load_peaks_txt(filename):
@@ -71,40 +104,38 @@ def load_peaks_txt(filename):
         jacobs_journal = [float(n) for n in file.read().split(",")]  
     return jacobs_journal
 
-def group_peaks(peaks, margin):
-    """Iteratively group peaks that are within margin of each other until
-    no more peaks are within margin of each other.
+def group_peaks(peaks, margin, min_range=config.MIN_RANGE, max_range=config.MAX_RANGE):
+    """Group sorted unique peaks into buckets, starting a new bucket
+    wherever a peak is more than margin past the peak before it. Only
+    return the buckets whose range is between min_range and max_range.
     """
     # Get all unique peaks and sorted them
-    unique_peaks = sorted(set(peaks))
-    
-    # Group the peaks into buckets
-    buckets = [Bucket(peaks=[unique_peaks[0]])]  # Put first peak in bucket to start
-    for peak in unique_peaks[1:]:  # skip the first peak
-        if buckets[-1][-1] + margin >= peak:
-            buckets[-1].add_peak(peak)
-        else:
-            buckets.append(Bucket([peak]))
+    unique_peaks = np.unique(np.asarray(peaks, dtype=float))
+    if len(unique_peaks) == 0:
+        return []
+
+    # Find where each bucket starts. Compare previous + margin with the
+    # peak like the old loop did rather than taking np.diff, because
+    # the two can round differently when the gap is exactly margin.
+    starts = np.flatnonzero(unique_peaks[:-1] + margin < unique_peaks[1:]) + 1
+    starts = np.concatenate([[0], starts])
+    ends = np.append(starts[1:], len(unique_peaks))
 
     # Remove any buckets outside of an allowed range
-    valid_buckets = []
-    for bucket in buckets:
-        # Check if the bucket's range is between the
-        # required bounds.
-        if (bucket.max - bucket.min > config.MIN_RANGE
-            and bucket.max - bucket.min < config.MAX_RANGE):
-            valid_buckets.append(bucket)
-    return valid_buckets
+    bucket_ranges = (np.maximum.reduceat(unique_peaks, starts)
+                     - np.minimum.reduceat(unique_peaks, starts))
+    valid = (bucket_ranges > min_range) & (bucket_ranges < max_range)
+    return [Bucket(unique_peaks[start:end].tolist())
+            for start, end in zip(starts[valid], ends[valid])]
 
 def name_chem_range(id_prefix, mean):
     """Return the name for a chemical range's mean."""
     return f"{id_prefix}{round(mean, 1)}_Area"
 
-def write_buckets(buckets, chemmeta_file, id_prefix=""):
-    for bucket in buckets:
-        line = f"{bucket.min},{bucket.max},{name_chem_range(id_prefix, bucket.mean)}\n"
-        chemmeta_file.write(line)
-    return
+def bucket_ranges(buckets, id_prefix=""):
+    """Return a (begin, end, chem_id) tuple for each bucket."""
+    return [(bucket.min, bucket.max, name_chem_range(id_prefix, bucket.mean))
+            for bucket in buckets]
 
 def add_chem(df, name, start, end):
     """Add a single new chem to the df."""
@@ -125,182 +156,238 @@ def merge_chem_times(df, cpp1, cpp2):
     return
 
 
-# Set up the chemical meta data file, erasing its contents if it
-# already exists.
-with open(config.CHEM_META_FILE, "w") as chemmeta_file:
-    chemmeta_file.write("BeginRetTime,EndRetTime,ChemicalID\n")
-
-    # Get the cardenolide specific buckets
-    card_buckets = group_peaks(load_peaks_txt(config.CARD_TXT), config.BUCKET_MARGIN)
-    # Write the card buckets to chemmeta
-    write_buckets(card_buckets, chemmeta_file, id_prefix="C")
-    print(f"Number of initial cardenolide buckets: {len(card_buckets)}")
-
-    # Get the phenylpropanoid specific buckets
-    pp_buckets =  group_peaks(load_peaks_txt(config.PP_TXT), config.BUCKET_MARGIN)
-    # Write the card buckets to chemmeta
-    write_buckets(pp_buckets, chemmeta_file, id_prefix="PP")
-    print(f"Number of initial phenylpropanoid buckets: {len(pp_buckets)}")
-
-
-# Get all unique overlapping card and pp pairs
-with open(config.CHEM_META_FILE, "r") as chemmeta_file:
-    lines = chemmeta_file.readlines()
-hits = set()
-header = lines.pop(0)
-for line in lines:
-    line = line.split(",")
-    begin, end, chem_id = line
-    #if chem_id[0] == 'P':
-        #break
-    begin = float(begin)
-    end = float(end)
-    for line in lines:
-        line = line.split(",")
-        begin2, end2, chem_id2 = line
-        if chem_id == chem_id2:
-            continue
-        begin2 = float(begin2)
-        end2 = float(end2)
-        if ((begin >= float(begin2) and begin <= float(end2))
-            or (end >= float(begin2) and end <= float(end2))):
-            hits.add(tuple(sorted((chem_id[:-1], chem_id2[:-1]))))
-            #hits.add((chem_id, chem_id2))
-
-# Handle overlapping PPs and Cs
-delete_me = set()
-df = pd.read_csv(config.CHEM_META_FILE, index_col=2)
-for c_name, pp_name in hits:
-    # Delete all of the ambiguous Cs and PPs
-    if config.DELETE_AMBIG:
-        # Get the range of the cardenolide
-        c_start, c_end = list(df.loc[c_name])
-        c_range = c_end - c_start
-        # Get the range of the phenylpropanoid
-        pp_start, pp_end = list(df.loc[pp_name])
-        pp_range = pp_end - pp_start
-        # Delete the compound with the smaller range,
-        # if they have the same range then delete both
-        if c_range < pp_range:
-            delete_me.add(c_name)
-        elif pp_range < c_range:
-            delete_me.add(pp_name)
+def resolve_overlaps(df, hits, delete_ambig):
+    """Either delete or relabel the overlapping cardenolide and
+    phenylpropanoid ranges in df. hits holds the (c_name, pp_name) pair
+    of every overlap.
+    """
+    # Handle overlapping PPs and Cs
+    delete_me = set()
+    for c_name, pp_name in hits:
+        # Delete all of the ambiguous Cs and PPs
+        if delete_ambig:
+            # Get the range of the cardenolide
+            c_start, c_end = list(df.loc[c_name])
+            c_range = c_end - c_start
+            # Get the range of the phenylpropanoid
+            pp_start, pp_end = list(df.loc[pp_name])
+            pp_range = pp_end - pp_start
+            # Delete the compound with the smaller range,
+            # if they have the same range then delete both
+            if c_range < pp_range:
+                delete_me.add(c_name)
+            elif pp_range < c_range:
+                delete_me.add(pp_name)
+            else:
+                delete_me.add(c_name)
+                delete_me.add(pp_name)
+
+        # Label ambiguous Cs and PPs
         else:
-            delete_me.add(c_name)
-            delete_me.add(pp_name)
-
-    # Label ambiguous Cs and PPs
-    else:
-
-        c1, c2 = df.loc[c_name]
-        p1, p2 = df.loc[pp_name]
-
-        # Start-End overlap
-        if c1 < p1 and c2 < p2:
-            # Modify C and PP
-            change_chem_times(df, c_name, pp_name, c1, p1, c2, p2)
-            # Add a CPP
-            merge_chem_times(df, p1 + 0.1, c2 - 0.1)
-        elif p1 < c1 and p2 < c2:
-            # Modify C and PP
-            change_chem_times(df, c_name, pp_name, p2, c2, p1, c1)
-            # Add a CPP
-            merge_chem_times(df, c1 + 0.1, p2 - 0.1)
-
-        # Contains
-        elif c1 < p1 and c2 > p2:
-            # Add two Cs
-            c_name1 = name_chem_range("C", (c1 + p1) / 2)
-            c_name2 = name_chem_range("C", (p2 + c2) / 2)
-            change_chem_times(df, c_name1, c_name2, c1, p1, p2, c2)
-            # Remove old C
-            delete_me.add(c_name)
-            # Add a CPP
-            merge_chem_times(df, p1 + 0.1, p2 - 0.1)
-        elif c1 > p1 and c2 < p2:
-            # Add two PPs
-            p_name1 = name_chem_range("PP", (p1 + c1) / 2)
-            p_name2 = name_chem_range("PP", (c2 + p2) / 2)
-            change_chem_times(df, p_name1, p_name2, p1, c1, c2, p2)
-            # Remove old PP
-            delete_me.add(pp_name)
-            # Add a CPP
-            merge_chem_times(df, c1 + 0.1, c2 - 0.1)
-
-        # Start-End same
-        elif c2 == p1 and c1 < p2:
-            # Just shift the p range over by 0.1
-            change_chem_times(df, c_name, pp_name, c1, c2, p1 + 0.1, p2)
-        elif p2 == c1 and p1 < c2:
-            # Just shift the c range over by 0.1
-            change_chem_times(df, c_name, pp_name, c1 + 0.1, c2, p1, p2)
+
+            c1, c2 = df.loc[c_name]
+            p1, p2 = df.loc[pp_name]
+
+            # Start-End overlap
+            if c1 < p1 and c2 < p2:
+                # Modify C and PP
+                change_chem_times(df, c_name, pp_name, c1, p1, c2, p2)
+                # Add a CPP
+                merge_chem_times(df, p1 + 0.1, c2 - 0.1)
+            elif p1 < c1 and p2 < c2:
+                # Modify C and PP
+                change_chem_times(df, c_name, pp_name, p2, c2, p1, c1)
+                # Add a CPP
+                merge_chem_times(df, c1 + 0.1, p2 - 0.1)
+
+            # Contains
+            elif c1 < p1 and c2 > p2:
+                # Add two Cs
+                c_name1 = name_chem_range("C", (c1 + p1) / 2)
+                c_name2 = name_chem_range("C", (p2 + c2) / 2)
+                change_chem_times(df, c_name1, c_name2, c1, p1, p2, c2)
+                # Remove old C
+                delete_me.add(c_name)
+                # Add a CPP
+                merge_chem_times(df, p1 + 0.1, p2 - 0.1)
+            elif c1 > p1 and c2 < p2:
+                # Add two PPs
+                p_name1 = name_chem_range("PP", (p1 + c1) / 2)
+                p_name2 = name_chem_range("PP", (c2 + p2) / 2)
+                change_chem_times(df, p_name1, p_name2, p1, c1, c2, p2)
+                # Remove old PP
+                delete_me.add(pp_name)
+                # Add a CPP
+                merge_chem_times(df, c1 + 0.1, c2 - 0.1)
+
+            # Start-End same
+            elif c2 == p1 and c1 < p2:
+                # Just shift the p range over by 0.1
+                change_chem_times(df, c_name, pp_name, c1, c2, p1 + 0.1, p2)
+            elif p2 == c1 and p1 < c2:
+                # Just shift the c range over by 0.1
+                change_chem_times(df, c_name, pp_name, c1 + 0.1, c2, p1, p2)
     
-        # Start-Start same
-        elif c1 == p1 and c2 < p2:
-            # Add a new PP range
-            add_chem(df, name_chem_range("PP", (c2 + p2) / 2), c2, p2)
-            # Delete old C range
-            delete_me.add(c_name)
-            # Add a CPP
-            merge_chem_times(df, c1, c2 - 0.1)
-        elif c1 == p1 and c2 > p2:
-            # Add a new C range
-            add_chem(df, name_chem_range("C", (p2 + c2) / 2), p2, c2)
-            # Delete old PP range
-            delete_me.add(pp_name)
-            # Add a CPP
-            merge_chem_times(df, p1, p2 - 0.1)
-
-        # End-End same
-        elif c2 == p2 and c1 < p1:
-            # Add a new C range
-            add_chem(df, name_chem_range("C", (c1 + p1) / 2), c1, p1)
-            # Delete old PP range
-            delete_me.add(pp_name)
-            # Add cpp
-            merge_chem_times(df, p1 + 0.1, p2)
-
-        elif c2 == p2 and c1 > p1:
-            # Add a new C range
-            add_chem(df, name_chem_range("PP", (p1 + c1) / 2), p1, c1)
-            # Delete old PP range
-            delete_me.add(c_name)
-            # Add cpp
-            merge_chem_times(df, c1 + 0.1, c2)
-
-        # Start-Start and End-End same
-        elif c1 == p1 and c2 == p2:
-            # Remove the old C range
-            delete_me.add(c_name)
-            # Remove the old PP range
-            delete_me.add(pp_name)
-            # Merge
-            merge_chem_times(df, c1, p1)
-
-        # Safety catch-all
-        else:
-            raise ValueError(f"Oh crap... {c1} {c2} and {p1} {p2} should overlap but didn't?")
-
-# Drop all necessary rows
-df.drop(labels=list(delete_me), axis=0, inplace=True)
-
-# Count PP, C, and CPP labels
-PP_count = 0
-C_count = 0
-CPP_count = 0
-for chem in df.index:
-    if re.match(r"PP\d+\.\d_Area", chem):
-        #print(chem, "is a PP")
-        PP_count += 1
-    elif re.match(r"CPP\d+\.\d_Area", chem):
-        #print(chem, "is a CPP")
-        CPP_count += 1
-    elif re.match(r"C\d+\.\d_Area", chem):
-        #print(chem, "is a C")
-        C_count += 1
-print(f"Number of initial cardenolide buckets: {C_count}")
-print(f"Number of initial phenylpropanoid buckets: {PP_count}")
-print(f"Number of initial ambiguous buckets: {CPP_count}")
-
-# Save the csv
-df.to_csv(config.CHEM_META_FILE)
+            # Start-Start same
+            elif c1 == p1 and c2 < p2:
+                # Add a new PP range
+                add_chem(df, name_chem_range("PP", (c2 + p2) / 2), c2, p2)
+                # Delete old C range
+                delete_me.add(c_name)
+                # Add a CPP
+                merge_chem_times(df, c1, c2 - 0.1)
+            elif c1 == p1 and c2 > p2:
+                # Add a new C range
+                add_chem(df, name_chem_range("C", (p2 + c2) / 2), p2, c2)
+                # Delete old PP range
+                delete_me.add(pp_name)
+                # Add a CPP
+                merge_chem_times(df, p1, p2 - 0.1)
+
+            # End-End same
+            elif c2 == p2 and c1 < p1:
+                # Add a new C range
+                add_chem(df, name_chem_range("C", (c1 + p1) / 2), c1, p1)
+                # Delete old PP range
+                delete_me.add(pp_name)
+                # Add cpp
+                merge_chem_times(df, p1 + 0.1, p2)
+
+            elif c2 == p2 and c1 > p1:
+                # Add a new C range
+                add_chem(df, name_chem_range("PP", (p1 + c1) / 2), p1, c1)
+                # Delete old PP range
+                delete_me.add(c_name)
+                # Add cpp
+                merge_chem_times(df, c1 + 0.1, c2)
+
+            # Start-Start and End-End same
+            elif c1 == p1 and c2 == p2:
+                # Remove the old C range
+                delete_me.add(c_name)
+                # Remove the old PP range
+                delete_me.add(pp_name)
+                # Merge
+                merge_chem_times(df, c1, p1)
+
+            # Safety catch-all
+            else:
+                raise ValueError(f"Oh crap... {c1} {c2} and {p1} {p2} should overlap but didn't?")
+
+    # Drop all necessary rows
+    df.drop(labels=list(delete_me), axis=0, inplace=True)
+    return
+
+
+def count_labels(df):
+    """Return the number of C, PP, and CPP labels in df."""
+    PP_count = 0
+    C_count = 0
+    CPP_count = 0
+    for chem in df.index:
+        if re.match(r"PP\d+\.\d_Area", chem):
+            #print(chem, "is a PP")
+            PP_count += 1
+        elif re.match(r"CPP\d+\.\d_Area", chem):
+            #print(chem, "is a CPP")
+            CPP_count += 1
+        elif re.match(r"C\d+\.\d_Area", chem):
+            #print(chem, "is a C")
+            C_count += 1
+    return C_count, PP_count, CPP_count
+
+
+def build_chemmeta(card_peaks, pp_peaks, margin, min_range, max_range,
+                   delete_ambig, verbose=True):
+    """Return the chemical meta data DataFrame, indexed by ChemicalID,
+    for the given cardenolide and phenylpropanoid peaks and settings.
+    """
+    with instrument.stage("group peaks", rows=len(card_peaks) + len(pp_peaks)):
+        # Get the cardenolide specific buckets
+        card_buckets = group_peaks(card_peaks, margin, min_range, max_range)
+        # Get the phenylpropanoid specific buckets
+        pp_buckets = group_peaks(pp_peaks, margin, min_range, max_range)
+    if verbose:
+        print(f"Number of initial cardenolide buckets: {len(card_buckets)}")
+        print(f"Number of initial phenylpropanoid buckets: {len(pp_buckets)}")
+
+    # Put the card buckets and then the pp buckets into a DataFrame
+    ranges = bucket_ranges(card_buckets, id_prefix="C") + bucket_ranges(pp_buckets, id_prefix="PP")
+    df = pd.DataFrame([(begin, end) for begin, end, _ in ranges],
+                      columns=["BeginRetTime", "EndRetTime"],
+                      index=pd.Index([chem_id for _, _, chem_id in ranges], name="ChemicalID"),
+                      dtype=float)
+
+    # Get all unique overlapping card and pp pairs, and handle them
+    with instrument.stage("find overlaps", rows=len(ranges)):
+        hits = find_overlaps(ranges)
+    with instrument.stage("resolve overlaps", rows=len(hits)):
+        resolve_overlaps(df, hits, delete_ambig)
+    return df
+
+
+def generate_chemmeta(card_txt, pp_txt, chem_meta_file, margin, min_range,
+                      max_range, delete_ambig, verbose=True):
+    """Build the chemical meta data from the peak library text files
+    card_txt and pp_txt, save it to chem_meta_file, and return it. Pass
+    None as chem_meta_file to skip saving.
+    """
+    # Load the peaks and build the chemical meta data
+    with instrument.stage("load peak libraries") as stage:
+        card_peaks = load_peaks_txt(card_txt)
+        pp_peaks = load_peaks_txt(pp_txt)
+        stage.rows = len(card_peaks) + len(pp_peaks)
+    df = build_chemmeta(card_peaks, pp_peaks, margin, min_range, max_range,
+                        delete_ambig, verbose)
+
+    # Save the csv, erasing its contents if it already exists.
+    if chem_meta_file is not None:
+        with instrument.stage("save chemmeta", rows=len(df.index)):
+            df.to_csv(chem_meta_file)
+    return df
+
+
+def cached_chemmeta(card_txt, pp_txt, margin, min_range, max_range, delete_ambig,
+                    cache_folder=config.CHEMMETA_CACHE_FOLDER,
+                    max_bytes=config.CHEMMETA_CACHE_MAX_BYTES, verbose=True):
+    """Return the path of the chemical meta data built from card_txt and
+    pp_txt with the given settings, only building it if it isn't in the
+    cache in cache_folder already. See chemmeta_cache.py.
+    """
+    path, hit = cache_lookup(card_txt, pp_txt, margin, min_range, max_range,
+                             delete_ambig, cache_folder)
+    if hit:
+        print(f"Using cached chemical meta data {path}")
+        return path
+    print(f"Building chemical meta data {path}")
+    # Build into a temporary file so an interrupted build never looks
+    # like a cache hit
+    generate_chemmeta(card_txt, pp_txt, f"{path}.tmp", margin, min_range,
+                      max_range, delete_ambig, verbose)
+    cache_store(f"{path}.tmp", path, max_bytes)
+    return path
+
+
+def main():
+    instrument.start()
+    path = cached_chemmeta(config.CARD_TXT,
+                           config.PP_TXT,
+                           config.BUCKET_MARGIN,
+                           config.MIN_RANGE,
+                           config.MAX_RANGE,
+                           config.DELETE_AMBIG)
+    # Save a copy where generate_dataset.py looks for it
+    shutil.copyfile(path, config.CHEM_META_FILE)
+    df = pd.read_csv(config.CHEM_META_FILE, index_col="ChemicalID")
+
+    # Count PP, C, and CPP labels
+    C_count, PP_count, CPP_count = count_labels(df)
+    print(f"Number of initial cardenolide buckets: {C_count}")
+    print(f"Number of initial phenylpropanoid buckets: {PP_count}")
+    print(f"Number of initial ambiguous buckets: {CPP_count}")
+    instrument.finish()
+    return
+
+
+if __name__ == "__main__":
+    main()
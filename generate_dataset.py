@@ -2,6 +2,7 @@
 Run after accumulate_report01s.py.
 """
 # Standard library imports
+import argparse
 import os
 import datetime
 
@@ -10,138 +11,618 @@ import pandas as pd
 import numpy as np
 
 # Import from our app
+from alignment import align_peaks
+from chem_ranges import ChemRanges
+from generate_chemmeta import cached_chemmeta
+from instrument import instrument
 from logger import Logger
+import peak_store
+from storage import (STORAGE_FORMATS, check_storage_format, is_stored_file, read_table,
+                     text_columns, write_table)
 import config
 
+# Columns that tell the samples in a DataFrame of peaks apart. Folders
+# X and XNew list their samples under the same parent directory, but
+# each keeps its own rows, so the folder is part of the key too.
+SAMPLE_KEYS = ["Folder", "ParentDirectory", "FileName"]
 
-def get_chem_id(ret_time, chemmeta_df):
-    """Return the chem_id associated with the retention range ret_time
-    falls in.
+
+def index_meta_data(meta_df, logger):
+    """Return a dict mapping each (FolderName, HPLCdatafilename) pair in
+    the meta data to its row, so a sample's meta data can be found
+    without searching the whole DataFrame. If a pair appears more than
+    once, log it and keep the first row.
     """
-    for line in chemmeta_df.values:
-        chem_id, begin_ret_time, end_ret_time = list(line)
-        if ret_time >= float(begin_ret_time) and ret_time <= float(end_ret_time):
-            return chem_id
-    return  # no id found, return None
+    meta_index = {}
+    duplicate_counts = {}
+    keys = zip(meta_df["FolderName"].values, meta_df["HPLCdatafilename"].values)
+    for key, row in zip(keys, meta_df.values.tolist()):
+        if key in meta_index:
+            duplicate_counts[key] = duplicate_counts.get(key, 1) + 1
+        else:
+            meta_index[key] = row
+    for (parent_directory, filename), count in duplicate_counts.items():
+        logger.log(f"{parent_directory}/{filename} appears {count} times in the super meta data file. Using the first row.")
+    return meta_index
 
 
-def get_meta_data(parent_directory, filename, meta_df):
+def get_meta_data(parent_directory, filename, meta_index, meta_columns, logger):
     """Return the meta data for a file name found in a specific
     directory.
     """
-    # Narrow down the meta_df by the parent folder name
-    dir_df = meta_df[meta_df["FolderName"] == parent_directory]
-    # Now filter out all rows that do not match the file name
-    file_df = dir_df[dir_df["HPLCdatafilename"] == filename]
+    # If there was no matching row, return a list full of "na"
+    meta_data = meta_index.get((parent_directory, filename))
+    if meta_data is None:
+        logger.log(f"{parent_directory}/{filename} could not be found in the super meta data file.")
+        meta_data = ["na"] * len(meta_columns)
+    return dict(zip(meta_columns, meta_data))
+
+
+def get_folder_name(processed_filename):
+    """Remove the acc_ and file extension parts from the
+    processed_filename to get the name of the raw data folder it was
+    accumulated from.
+    """
+    return os.path.splitext(processed_filename)[0][4:]
+
+
+def get_parent_directory(processed_filename):
+    """Remove the acc_ and file extension parts from the
+    processed_filename to get the parent directory name of the files
+    referenced within the file. Also remove New from the filename.
+    """
+    return get_folder_name(processed_filename).replace("New", "")
+
+
+def build_dataset_legacy(processed_input_folder, processed_filenames,
+                         chem_ranges, chem_columns, meta_index, meta_columns, logger,
+                         storage_format="csv"):
+    """Return the final dataset, built one processed file and one
+    sample at a time.
+    """
+    # DataFrame where all the output will be located
+    output_df = pd.DataFrame(columns=(meta_columns + chem_columns))
+
+    processed_file_counter = 1
+    for processed_filename in processed_filenames:
+        print(f"Starting processed file {processed_file_counter}/{len(processed_filenames)} {processed_filename}")
+        # Read the processed file into a DataFrame
+        with instrument.stage("load processed file", item=processed_filename) as stage:
+            df = read_table(f"{processed_input_folder}/{processed_filename}", storage_format)
+            stage.rows = len(df.index)
+        parent_directory = get_parent_directory(processed_filename)
+
+        # Get the chem_id of every peak in the file at once
+        with instrument.stage("assign chem ids", item=processed_filename, rows=len(df.index)):
+            chem_ids = chem_ranges.lookup(df["RetTime"].values)
+
+        # Get a list of the file names listed inside the processed file,
+        # and add one row detailing the chemicals found in that sample for
+        # each file name.
+        unique_inner_filenames = set([*df["FileName"].values])
+        print(f"\t~Finalizing data ({len(unique_inner_filenames)}):")
+        unique_inner_counter = 1
+        with instrument.stage("finalize samples", item=processed_filename,
+                              rows=len(unique_inner_filenames)):
+            for filename in unique_inner_filenames:
+                print(f"\t\t-> {unique_inner_counter}/{len(unique_inner_filenames)} {filename}")
+                # Get the meta data for this file
+                meta_data = get_meta_data(parent_directory, filename, meta_index, meta_columns, logger)
+
+                # Assemble the output row for output_df
+                output_row = meta_data
+                output_row.update({chem_id: -1 for chem_id in chem_columns})
+
+                # Get a DataFrame for all the chem_ids and areas for this file
+                # name
+                in_file = (df["FileName"] == filename).values
+                chem_data = zip(chem_ids[in_file], df["Area"].values[in_file])
+                for chem_id, area in chem_data:
+                    if chem_id != None and area > output_row.get(chem_id):
+                        output_row.update({chem_id: area})
+
+                # Update the output DataFrame
+                output_df.loc[len(output_df.index)] = output_row
+
+                # Update unique inner file counter
+                unique_inner_counter += 1
+
+        # Update processed file progression counter
+        processed_file_counter += 1
+
+    # Replace all -1 chem ids with NaN
+    output_df[chem_columns] = output_df[chem_columns].replace(-1, np.nan)
+    return output_df
+
+
+def load_processed_peaks(processed_input_folder, processed_filenames, storage_format="csv"):
+    """Return the retention times and areas from every processed file in
+    one DataFrame, along with the folder, parent directory, and file
+    name of the sample each peak came from.
+    """
+    dfs = []
+    for processed_filename in processed_filenames:
+        with instrument.stage("load processed file", item=processed_filename) as stage:
+            df = read_table(f"{processed_input_folder}/{processed_filename}", storage_format,
+                            columns=["FileName", "RetTime", "Area"])
+            # A category only holds the file names of one processed file,
+            # so turn it back into strings before combining files
+            df["FileName"] = df["FileName"].astype(object)
+            df.insert(0, "Folder", get_folder_name(processed_filename))
+            df.insert(1, "ParentDirectory", get_parent_directory(processed_filename))
+            stage.rows = len(df.index)
+        dfs.append(df)
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=SAMPLE_KEYS + ["RetTime", "Area"])
+    return pd.concat(dfs, ignore_index=True)
+
 
-    # Convert those values into a list. If there were no matching rows
-    # found, catch the IndexError and return an list full of None.
+def find_samples(peaks_df):
+    """Return the folder, parent directory, and file name of every
+    sample in peaks_df, in the order each first appears.
+    """
+    return peaks_df[SAMPLE_KEYS].drop_duplicates()
+
+
+def sample_meta_data(samples, meta_index, meta_columns, logger):
+    """Return a DataFrame of each sample's meta data, one row per
+    sample.
+    """
+    with instrument.stage("look up meta data", rows=len(samples.index)):
+        meta_rows = [get_meta_data(parent_directory, filename, meta_index, meta_columns, logger)
+                     for parent_directory, filename in samples[["ParentDirectory", "FileName"]].values]
+        return pd.DataFrame(meta_rows, columns=meta_columns)
+
+
+def chem_areas(peaks_df, samples, chem_ranges, chem_columns):
+    """Return an array of the largest area of each chemical in each
+    sample, one row per sample and one column per chemical. Chemicals a
+    sample doesn't have are left as NaN.
+    """
+    sample_keys = SAMPLE_KEYS
+    # Give every peak its chem_id in one pass and keep the ones that
+    # fell in a range. Areas of -1 or less never beat the -1 the old
+    # engine started each chemical at, so drop those too.
+    with instrument.stage("assign chem ids", rows=len(peaks_df.index)):
+        chem_ids = chem_ranges.lookup(peaks_df["RetTime"].values)
+        matched = (chem_ids != None) & (peaks_df["Area"].values > -1)
+        matched_df = peaks_df.loc[matched, sample_keys + ["Area"]]
+        matched_df["ChemicalID"] = chem_ids[matched]
+
+    # Take the largest area of each chemical in each sample, one column
+    # per chemical.
+    with instrument.stage("aggregate areas", rows=len(matched_df.index)):
+        areas_df = (matched_df.groupby(sample_keys + ["ChemicalID"], sort=False)["Area"]
+                    .max()
+                    .unstack("ChemicalID")
+                    .reindex(columns=chem_columns))
+        areas_df = areas_df.reindex(pd.MultiIndex.from_frame(samples))
+    return areas_df.values
+
+
+def build_dataset(peaks_df, chem_ranges, chem_columns, meta_index, meta_columns, logger):
+    """Return the final dataset, built from every processed peak at
+    once. Gives the same rows as build_dataset_legacy(), which builds
+    each processed file's rows on their own, ordered by when each sample
+    first appears in peaks_df.
+    """
+    # One output row per sample
+    samples = find_samples(peaks_df)
+    areas = chem_areas(peaks_df, samples, chem_ranges, chem_columns)
+    output_df = sample_meta_data(samples, meta_index, meta_columns, logger)
+    output_df[chem_columns] = areas
+    return output_df
+
+
+def build_datasets(peaks_df, chem_variants, meta_df):
+    """Yield a final dataset for each (chem_ranges, chem_columns) pair
+    in chem_variants, like build_dataset() would, one at a time so only
+    one of them is held in memory. meta_df is the meta data of every
+    sample in peaks_df, see sample_meta_data(), so it is only looked up
+    once for all of them.
+    """
+    samples = find_samples(peaks_df)
+    for chem_ranges, chem_columns in chem_variants:
+        output_df = meta_df.copy()
+        output_df[chem_columns] = chem_areas(peaks_df, samples, chem_ranges, chem_columns)
+        yield output_df
+
+
+def build_dataset_sql(conn, chem_columns, meta_index, meta_columns, logger):
+    """Return the final dataset, built from the peaks in a peak store
+    database. Gives the same rows as build_dataset(), ordered by when
+    each sample's first peak was stored.
+    """
+    with instrument.stage("match peaks in sqlite"):
+        samples, areas_df = peak_store.chem_areas(conn)
+
+    # One column per chemical. Chemicals a sample doesn't have are left
+    # as NaN.
+    with instrument.stage("aggregate areas", rows=len(areas_df.index)):
+        areas_df = (areas_df.set_index(SAMPLE_KEYS + ["ChemicalID"])["Area"]
+                    .unstack("ChemicalID")
+                    .reindex(columns=chem_columns))
+        areas_df = areas_df.reindex(pd.MultiIndex.from_frame(samples))
+
+    # Look up each sample's meta data
+    output_df = sample_meta_data(samples, meta_index, meta_columns, logger)
+    output_df[chem_columns] = areas_df.values
+    return output_df
+
+
+def load_chem_ranges(chem_meta_file):
+    """Return the compiled retention time ranges in a chemical meta data
+    file, and a sorted list of its unique chemical ids.
+    """
     try:
-        meta_data = list(file_df.values[0])
-    except IndexError:
-        logger.log(f"{parent_directory}/{filename} could not be found in the super meta data file.")
-        meta_data = ["na"] * len(meta_df.columns)
-    return dict(zip(meta_df.columns, meta_data))
-
-
-# Create an object to log errors that occur. Don't erase the contents
-# when run to preserve error logs from accumulate_report01s.py
-logger = Logger("", "log.txt", erase_on_init=False)
-
-# Define a folder for where all intermediate input data should be.
-# PIF stands for processed input folder.
-PIF = config.PROCESSED_INPUT_FOLDER
-# Raise an error if the ProcessedInput folder doesn't exist because
-# that means the user hasn't run accumulate_report01s.py yet.
-if not os.path.exists(PIF):
-    raise OSError("The directory ProcessedInput does not exist. Please run accumulate_report01s.py to create and populate it.")
-
-# Define a folder where the output will go. OF stands for output folder
-OF = config.OUTPUT_FOLDER
-# Make the output folder if it doesn't exist
-if not os.path.exists(OF):
-    print("Output directory did not exist: Created Output.")
-    os.mkdir("Output")
-
-# Get the chemical meta data for reference later
-chem_meta_file = config.CHEM_META_FILE
-try:
-    chemmeta_df = pd.read_csv(chem_meta_file)
-except FileNotFoundError:
-    print(f"Chem meta file '{chem_meta_file}' not found. Please ensure you have created this file and input its path in config.py.")
-    quit()
-# Get a list of all unique chemical ids
-all_chem_ids = list(set(chemmeta_df["ChemicalID"]))
-
-# Get the sample meta data for reference later
-super_meta_file = config.SUPER_META_FILE
-try:
-    meta_df = pd.read_csv("supermeta.csv")
-except FileNotFoundError:
-    print(f"Super meta file '{super_meta_file}' not found. Please ensure you have created this file and input its path in config.py.")
-    quit()
-# Sort the meta data for easier reference
-meta_df = meta_df.sort_values(by=["HPLCdatafilename"])
-# Get a list of the columns in meta_df
-meta_columns = list(meta_df.columns)
-
-# DataFrame where all the output will be located
-output_df = pd.DataFrame(columns=(meta_columns + sorted(all_chem_ids)))
-
-# Get all csv files by name into a list.
-processed_filenames = [fn for fn in os.listdir(PIF) if fn[-4:] == ".csv"]
-processed_file_counter = 1
-for processed_filename in processed_filenames:
-    print(f"Starting processed file {processed_file_counter}/{len(processed_filenames)} {processed_filename}")
-    # Read the processed csv file into a DataFrame
-    df = pd.read_csv(f"{PIF}/{processed_filename}")
-    
-    # Remove the acc_ and .csv parts from the processed_filename
-    # to get the parent directory name of the files referenced within
-    # the csv. Also remove New from the filename.
-    parent_directory = processed_filename[4:].replace(".csv", "").replace("New", "")
-    
-    # Get a list of the file names listed inside the processed file,
-    # and add one row detailing the chemicals found in that sample for
-    # each file name.
-    unique_inner_filenames = set([*df["FileName"].values])
-    print(f"\t~Finalizing data ({len(unique_inner_filenames)}):")
-    unique_inner_counter = 1
-    for filename in unique_inner_filenames:
-        print(f"\t\t-> {unique_inner_counter}/{len(unique_inner_filenames)} {filename}")
-        # Get the meta data for this file
-        meta_data = get_meta_data(parent_directory, filename, meta_df)
-
-        # Assemble the output row for output_df
-        output_row = meta_data
-        output_row.update({chem_id: -1 for chem_id in sorted(all_chem_ids)})
-
-        # Get a DataFrame for all the retention times and areas for
-        # this file name
-        chem_data = df[df["FileName"] == filename][["RetTime", "Area"]].values
-        for ret_time, area in chem_data:
-            chem_id = get_chem_id(ret_time, chemmeta_df)
-            if chem_id != None and area > output_row.get(chem_id):
-                output_row.update({chem_id: area})
-        
-        # Update the output DataFrame
-        output_df.loc[len(output_df.index)] = output_row
-        
-        # Update unique inner file counter
-        unique_inner_counter += 1
-
-    # Update processed file progression counter
-    processed_file_counter += 1
-
-# Replace all -1 chem ids with NaN
-for chem_id in all_chem_ids:
-    output_df[chem_id].replace(-1, np.NaN, inplace=True)
-
-# Save the final dataset if it is not empty
-if len(output_df.values) > 0:
+        with instrument.stage("load chemmeta"):
+            chemmeta_df = pd.read_csv(chem_meta_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Chem meta file '{chem_meta_file}' not found. Please ensure you have created this file and input its path in config.py.")
+    # Get a sorted list of all unique chemical ids
+    chem_columns = sorted(set(chemmeta_df["ChemicalID"]))
+    # Compile the retention time ranges for fast lookups
+    with instrument.stage("compile chem ranges", rows=len(chemmeta_df.index)):
+        chem_ranges = ChemRanges(chemmeta_df)
+    return chem_ranges, chem_columns
+
+
+def load_meta_index(super_meta_file, logger):
+    """Return the sample meta data in a super meta data file indexed by
+    folder and file name, and a list of its columns.
+    """
+    try:
+        with instrument.stage("load supermeta"):
+            meta_df = pd.read_csv(super_meta_file)
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Super meta file '{super_meta_file}' not found. Please ensure you have created this file and input its path in config.py.")
+    # Sort the meta data for easier reference, then index it by folder
+    # and file name
+    meta_df = meta_df.sort_values(by=["HPLCdatafilename"], kind="stable")
+    meta_columns = list(meta_df.columns)
+    with instrument.stage("index supermeta", rows=len(meta_df.index)):
+        meta_index = index_meta_data(meta_df, logger)
+    return meta_index, meta_columns
+
+
+def dataset_filename(storage_format="csv"):
+    """Return the name of a final dataset saved now."""
     # Year, month, day, hour, minute
     now_str = datetime.datetime.now().strftime('%Y-%m-%d-%I-%M')
-    output_df.to_csv(f"{OF}/finalDataset{now_str}.csv", index=False, index_label=False)
+    return f"finalDataset{now_str}{STORAGE_FORMATS[storage_format]}"
+
+
+def save_dataset(output_df, output_folder, storage_format="csv", filename=None):
+    """Save the final dataset in output_folder in storage_format, named
+    filename or after the current time, if it is not empty. Return the
+    path it was saved to, or None.
+    """
+    output_path = None
+    if len(output_df.index) > 0:
+        if filename is None:
+            filename = dataset_filename(storage_format)
+        output_path = f"{output_folder}/{filename}"
+        with instrument.stage("save dataset", rows=len(output_df.index)):
+            if storage_format != "csv":
+                output_df = text_columns(output_df)
+            # Write to a temporary file first so the dataset is never
+            # left half written for anyone reading it
+            write_table(output_df, f"{output_path}.tmp", storage_format)
+            os.replace(f"{output_path}.tmp", output_path)
+        print(f"*Finalized and saved*")
+    else:
+        print(f"*No data to save*")
+    return output_path
+
+
+def write_dataset_chunks(peaks_df, chem_ranges, chem_columns, meta_index, meta_columns,
+                         logger, output_folder, chunk_size=1000, area_dtype="float64",
+                         filename=None, meta_df=None):
+    """Save the final dataset build_dataset() would return as a csv file
+    in output_folder, named filename or after the current time, without
+    ever holding the whole table in memory. The largest area of each
+    chemical in each sample is kept in a long table with one row per
+    area found, and only chunk_size samples at a time are spread out into
+    the wide table and written. Areas are written as area_dtype, with NaN
+    for the chemicals a sample doesn't have. Return the path the dataset
+    was saved to, or None if there was no data to save.
+
+    If meta_df is given, it is the meta data of every sample, see
+    sample_meta_data(), and each chunk's rows are taken from it instead
+    of being looked up again.
+    """
+    sample_keys = SAMPLE_KEYS
+    n_chems = len(chem_columns)
+    # Number the samples in the order they first appear, and the
+    # chemicals by their column
+    sample_codes, samples = pd.factorize(pd.MultiIndex.from_frame(peaks_df[sample_keys]))
+    if len(samples) == 0:
+        print(f"*No data to save*")
+        return None
+
+    # Same matching as build_dataset()
+    with instrument.stage("assign chem ids", rows=len(peaks_df.index)):
+        chem_ids = chem_ranges.lookup(peaks_df["RetTime"].values)
+        matched = (chem_ids != None) & (peaks_df["Area"].values > -1)
+        # Samples missing part of their key still get a row, but no
+        # areas, the same as groupby() leaves them in build_dataset().
+        # Their keys would also land in the wrong cells.
+        matched &= (sample_codes >= 0) & peaks_df[sample_keys].notna().all(axis=1).to_numpy()
+        chem_codes = pd.Index(chem_columns).get_indexer(chem_ids[matched])
+
+    # One key per cell of the wide table, in row order, and the largest
+    # area that landed in it
+    with instrument.stage("aggregate areas", rows=int(matched.sum())):
+        cell_keys = sample_codes[matched].astype(np.int64) * n_chems + chem_codes
+        cell_areas = pd.Series(peaks_df["Area"].values[matched]).groupby(cell_keys).max()
+        cell_keys = cell_areas.index.to_numpy()
+        cell_areas = cell_areas.to_numpy()
+
+    if filename is None:
+        filename = dataset_filename()
+    output_path = f"{output_folder}/{filename}"
+    with instrument.stage("save dataset", rows=len(samples)):
+        # Write to a temporary file first so the dataset is never left
+        # half written for anyone reading it
+        with open(f"{output_path}.tmp", "w", newline="") as file:
+            for start in range(0, len(samples), chunk_size):
+                stop = min(start + chunk_size, len(samples))
+                first, last = np.searchsorted(cell_keys, [start * n_chems, stop * n_chems])
+                areas = np.full((stop - start, n_chems), np.nan, dtype=area_dtype)
+                areas.flat[cell_keys[first:last] - start * n_chems] = cell_areas[first:last]
+
+                if meta_df is None:
+                    meta_rows = [get_meta_data(parent_directory, sample_filename, meta_index,
+                                               meta_columns, logger)
+                                 for _, parent_directory, sample_filename in samples[start:stop]]
+                    chunk_meta_df = pd.DataFrame(meta_rows, columns=meta_columns)
+                else:
+                    chunk_meta_df = meta_df.iloc[start:stop].reset_index(drop=True)
+                chunk_df = pd.concat([chunk_meta_df, pd.DataFrame(areas, columns=chem_columns)], axis=1)
+                chunk_df.to_csv(file, header=(start == 0), index=False, index_label=False)
+        os.replace(f"{output_path}.tmp", output_path)
     print(f"*Finalized and saved*")
-else:
-    print(f"*No data to save*")
+    return output_path
+
+
+def generate_dataset(processed_input_folder, chem_meta_file, super_meta_file,
+                     output_folder, engine="vectorized", logger=None, storage_format="csv",
+                     peak_database=None, align=False, alignment_file=None,
+                     manifest_file=None, chunk_size=None, area_dtype="float64"):
+    """Build the final dataset from the processed files in
+    processed_input_folder and save it in output_folder, both stored in
+    storage_format. Return the path it was saved to, or None if there was
+    no data to save.
+
+    engine is "vectorized", "legacy", or "sqlite". The sqlite engine
+    builds the dataset from the peaks in the peak_database file instead
+    of the processed files, and stores the chemical and sample meta data
+    there too.
+
+    If align is True, each folder's retention times are shifted to line
+    up its standard runs with the other folders' before they are matched
+    to chemicals, see alignment.py. The fitted anchors are cached in
+    alignment_file, and fitted again when the standard runs' reports in
+    manifest_file change. Only the vectorized engine aligns retention
+    times.
+
+    If chunk_size is given, the vectorized engine writes a csv dataset
+    chunk_size samples at a time instead of building it all in memory,
+    see write_dataset_chunks(). Areas are written as area_dtype.
+
+    Samples missing from the
+    super meta data are logged to logger, or to log.txt if there isn't
+    one.
+    """
+    check_storage_format(storage_format)
+    if align and engine != "vectorized":
+        raise ValueError(f"Retention times can only be aligned by the vectorized engine, not the {engine} engine.")
+    # Log to log.txt unless the caller has a logger
+    own_logger = logger is None
+    if own_logger:
+        logger = Logger("", "log.txt")
+
+    # Define a folder for where all intermediate input data should be.
+    # PIF stands for processed input folder.
+    PIF = processed_input_folder
+    # Raise an error if the ProcessedInput folder or peak database doesn't
+    # exist because that means the user hasn't run accumulate_report01s.py
+    # yet.
+    if engine == "sqlite":
+        if peak_database is None or not os.path.exists(peak_database):
+            raise OSError("The peak database does not exist. Please set PEAK_DATABASE in config.py and run accumulate_report01s.py to create and populate it.")
+    elif not os.path.exists(PIF):
+        raise OSError("The directory ProcessedInput does not exist. Please run accumulate_report01s.py to create and populate it.")
+
+    # Define a folder where the output will go. OF stands for output folder
+    OF = output_folder
+    # Make the output folder if it doesn't exist
+    if not os.path.exists(OF):
+        print(f"{OF} directory did not exist: Created {OF}.")
+        os.mkdir(OF)
+
+    # Get the chemical and sample meta data for reference later
+    chem_ranges, chem_columns = load_chem_ranges(chem_meta_file)
+    meta_index, meta_columns = load_meta_index(super_meta_file, logger)
+
+    if engine == "sqlite":
+        conn = peak_store.connect(peak_database)
+        with instrument.stage("store meta tables"):
+            peak_store.store_meta_tables(conn, chem_meta_file, super_meta_file)
+        print(f"Building the dataset from {peak_database}")
+        output_df = build_dataset_sql(conn, chem_columns, meta_index, meta_columns, logger)
+        conn.close()
+    else:
+        # Get all processed files by name into a list.
+        processed_filenames = [fn for fn in os.listdir(PIF) if is_stored_file(fn, storage_format)]
+        if engine == "legacy":
+            output_df = build_dataset_legacy(PIF, processed_filenames, chem_ranges,
+                                             chem_columns, meta_index, meta_columns, logger,
+                                             storage_format)
+        else:
+            print(f"Loading {len(processed_filenames)} processed files")
+            peaks_df = load_processed_peaks(PIF, processed_filenames, storage_format)
+            if align:
+                print("\t~Aligning retention times")
+                with instrument.stage("align retention times", rows=len(peaks_df.index)):
+                    peaks_df["RetTime"] = align_peaks(peaks_df, meta_index, meta_columns,
+                                                      logger, alignment_file, manifest_file)
+            print(f"\t~Finalizing data ({len(peaks_df.index)} peaks)")
+            if chunk_size is not None and storage_format == "csv":
+                # Written as it is built, there's nothing left to save
+                output_df = None
+                output_path = write_dataset_chunks(peaks_df, chem_ranges, chem_columns,
+                                                   meta_index, meta_columns, logger, OF,
+                                                   chunk_size, area_dtype)
+            else:
+                output_df = build_dataset(peaks_df, chem_ranges, chem_columns,
+                                          meta_index, meta_columns, logger)
+
+    if output_df is not None:
+        if area_dtype != "float64":
+            output_df = output_df.astype({chem_id: area_dtype for chem_id in chem_columns})
+        output_path = save_dataset(output_df, OF, storage_format)
+    if own_logger:
+        logger.close()
+    return output_path
+
+
+def generate_datasets(processed_input_folder, chem_meta_files, super_meta_file,
+                      output_folder, logger=None, storage_format="csv",
+                      align=False, alignment_file=None, manifest_file=None,
+                      chunk_size=None, area_dtype="float64"):
+    """Build a final dataset for each chemical meta data file in
+    chem_meta_files and save them in output_folder, each named after the
+    current time and its chemical meta data file. The processed files
+    and super meta data are only read once for all of them. Return the
+    paths they were saved to, with None for any that had no data.
+
+    The datasets are built and saved one at a time. If chunk_size is
+    given, each csv dataset is also written chunk_size samples at a
+    time, see write_dataset_chunks().
+
+    Uses the vectorized engine, see generate_dataset() for the other
+    arguments. Raise a ValueError if two of the chemical meta data files
+    have the same name, since their datasets would be saved under the
+    same name too.
+    """
+    check_storage_format(storage_format)
+    # Tell the datasets apart by their chemical meta data file
+    variants = [os.path.splitext(os.path.basename(chem_meta_file))[0] for chem_meta_file in chem_meta_files]
+    for variant in set(variants):
+        same_name = [chem_meta_file for chem_meta_file, other in zip(chem_meta_files, variants) if other == variant]
+        if len(same_name) > 1:
+            raise ValueError(f"The chemical meta data files {', '.join(same_name)} would all be saved as {variant}. Please rename all but one of them.")
+    # Log to log.txt unless the caller has a logger
+    own_logger = logger is None
+    if own_logger:
+        logger = Logger("", "log.txt")
+
+    PIF = processed_input_folder
+    if not os.path.exists(PIF):
+        raise OSError("The directory ProcessedInput does not exist. Please run accumulate_report01s.py to create and populate it.")
+    OF = output_folder
+    if not os.path.exists(OF):
+        print(f"{OF} directory did not exist: Created {OF}.")
+        os.mkdir(OF)
+
+    # Get every variant of the chemical meta data, and the sample meta
+    # data once
+    chem_variants = [load_chem_ranges(chem_meta_file) for chem_meta_file in chem_meta_files]
+    meta_index, meta_columns = load_meta_index(super_meta_file, logger)
+
+    processed_filenames = [fn for fn in os.listdir(PIF) if is_stored_file(fn, storage_format)]
+    print(f"Loading {len(processed_filenames)} processed files")
+    peaks_df = load_processed_peaks(PIF, processed_filenames, storage_format)
+    if align:
+        print("\t~Aligning retention times")
+        with instrument.stage("align retention times", rows=len(peaks_df.index)):
+            peaks_df["RetTime"] = align_peaks(peaks_df, meta_index, meta_columns,
+                                              logger, alignment_file, manifest_file)
+    print(f"\t~Finalizing data ({len(peaks_df.index)} peaks, {len(chem_variants)} chemical meta data files)")
+    # The samples' meta data is the same for every variant
+    meta_df = sample_meta_data(find_samples(peaks_df), meta_index, meta_columns, logger)
+
+    # Year, month, day, hour, minute
+    now_str = datetime.datetime.now().strftime('%Y-%m-%d-%I-%M')
+    filenames = [f"finalDataset{now_str}_{variant}{STORAGE_FORMATS[storage_format]}" for variant in variants]
+    output_paths = []
+    if chunk_size is not None and storage_format == "csv":
+        for variant, filename, (chem_ranges, chem_columns) in zip(variants, filenames, chem_variants):
+            print(f"{variant}:")
+            output_paths.append(write_dataset_chunks(peaks_df, chem_ranges, chem_columns,
+                                                     meta_index, meta_columns, logger, OF,
+                                                     chunk_size, area_dtype, filename, meta_df))
+    else:
+        output_dfs = build_datasets(peaks_df, chem_variants, meta_df)
+        for variant, filename, (_, chem_columns), output_df in zip(variants, filenames, chem_variants, output_dfs):
+            print(f"{variant}:")
+            if area_dtype != "float64":
+                output_df = output_df.astype({chem_id: area_dtype for chem_id in chem_columns})
+            output_paths.append(save_dataset(output_df, OF, storage_format, filename))
+    if own_logger:
+        logger.close()
+    return output_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the final dataset from the processed files.")
+    parser.add_argument("--chem-meta", nargs="+", default=None, metavar="FILE",
+                        help="build one dataset for each of these chemical meta data files, "
+                             "reading the processed files only once. Needs the vectorized "
+                             "DATASET_ENGINE")
+    args = parser.parse_args()
+    if args.chem_meta is not None and config.DATASET_ENGINE != "vectorized":
+        parser.error(f"--chem-meta only works with the vectorized DATASET_ENGINE, not {config.DATASET_ENGINE}.")
+
+    instrument.start()
+    # Create an object to log errors that occur. Don't erase the contents
+    # when run to preserve error logs from accumulate_report01s.py
+    logger = Logger("", "log.txt", erase_on_init=False, json_lines=config.LOG_JSON_LINES)
+    try:
+        if args.chem_meta is not None:
+            generate_datasets(config.PROCESSED_INPUT_FOLDER,
+                              args.chem_meta,
+                              config.SUPER_META_FILE,
+                              config.OUTPUT_FOLDER,
+                              logger=logger,
+                              storage_format=config.STORAGE_FORMAT,
+                              align=config.ALIGN_RET_TIMES,
+                              alignment_file=config.ALIGNMENT_FILE,
+                              manifest_file=config.MANIFEST_FILE,
+                              chunk_size=config.DATASET_CHUNK_SIZE,
+                              area_dtype=config.DATASET_AREA_DTYPE)
+        else:
+            chem_meta_file = config.CHEM_META_FILE
+            if config.CHEM_META_FROM_CACHE:
+                # Build the chemical meta data for the current settings
+                # if it isn't cached yet
+                chem_meta_file = cached_chemmeta(config.CARD_TXT,
+                                                 config.PP_TXT,
+                                                 config.BUCKET_MARGIN,
+                                                 config.MIN_RANGE,
+                                                 config.MAX_RANGE,
+                                                 config.DELETE_AMBIG,
+                                                 verbose=False)
+            generate_dataset(config.PROCESSED_INPUT_FOLDER,
+                             chem_meta_file,
+                             config.SUPER_META_FILE,
+                             config.OUTPUT_FOLDER,
+                             engine=config.DATASET_ENGINE,
+                             logger=logger,
+                             storage_format=config.STORAGE_FORMAT,
+                             peak_database=config.PEAK_DATABASE,
+                             align=config.ALIGN_RET_TIMES,
+                             alignment_file=config.ALIGNMENT_FILE,
+                             manifest_file=config.MANIFEST_FILE,
+                             chunk_size=config.DATASET_CHUNK_SIZE,
+                             area_dtype=config.DATASET_AREA_DTYPE)
+    except FileNotFoundError as e:
+        print(e)
+    logger.close()
+    instrument.finish()
+    return
+
+
+if __name__ == "__main__":
+    main()
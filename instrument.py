@@ -0,0 +1,122 @@
+"""Time each stage of the pipeline, and optionally profile it.
+
+Every script reports to the same shared instrument:
+
+    from instrument import instrument
+
+    with instrument.stage("parse report", item=path) as stage:
+        ...
+        stage.rows = len(rows)
+
+Nothing is recorded unless INSTRUMENT is True in config.py. When it is,
+instrument.finish() prints the wall time, row count, and rows per second
+of every stage, along with the slowest folders and files. If
+PROFILE_FILE is set, the run is also profiled with cProfile and the
+stats are saved there.
+"""
+# Standard library imports
+import cProfile
+import pstats
+import time
+from contextlib import contextmanager
+
+# Import from our app
+import config
+
+
+class Stage:
+    """The timing of one pass through a stage."""
+    __slots__ = ("name", "item", "rows", "seconds")
+
+    def __init__(self, name, item=None, rows=None, seconds=0.0):
+        self.name = name
+        self.item = item
+        self.rows = rows
+        self.seconds = seconds
+        return
+
+
+class Instrument:
+    def __init__(self, enabled=False, profile_file=None):
+        self.enabled = enabled
+        self.profile_file = profile_file
+        self.stages = []
+        self._profiler = None
+        return
+
+    @contextmanager
+    def stage(self, name, item=None, rows=None):
+        """Time the code inside the with block as a pass through the
+        named stage. item names the folder or file being worked on. Set
+        rows on the yielded Stage once the row count is known.
+        """
+        stage = Stage(name, item, rows)
+        if not self.enabled:
+            yield stage
+            return
+        start = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - start
+            self.stages.append(stage)
+
+    def take_stages(self):
+        """Return and forget the stages recorded so far. Worker
+        processes return these so the main process can merge() them.
+        """
+        stages = self.stages
+        self.stages = []
+        return stages
+
+    def merge(self, stages):
+        """Add stages recorded by a worker process."""
+        if self.enabled:
+            self.stages.extend(stages)
+        return
+
+    def start(self):
+        """Start profiling, if there is a profile file to save to."""
+        if self.enabled and self.profile_file is not None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        return
+
+    def report(self, slowest=10):
+        """Return a summary of every stage and the slowest items."""
+        totals = {}
+        for stage in self.stages:
+            calls, seconds, rows = totals.get(stage.name, (0, 0.0, 0))
+            totals[stage.name] = (calls + 1, seconds + stage.seconds, rows + (stage.rows or 0))
+
+        lines = [f"{'Stage':<28}{'Calls':>8}{'Seconds':>12}{'Rows':>12}{'Rows/sec':>14}"]
+        for name, (calls, seconds, rows) in totals.items():
+            rate = f"{rows / seconds:.0f}" if rows and seconds > 0 else "-"
+            lines.append(f"{name:<28}{calls:>8}{seconds:>12.3f}{rows:>12}{rate:>14}")
+
+        items = sorted([stage for stage in self.stages if stage.item is not None],
+                       key=lambda stage: stage.seconds, reverse=True)[:slowest]
+        if items:
+            lines.append("")
+            lines.append(f"Slowest {len(items)} folders and files:")
+            for stage in items:
+                rows = "" if stage.rows is None else f" ({stage.rows} rows)"
+                lines.append(f"\t{stage.seconds:>10.3f}s {stage.name}: {stage.item}{rows}")
+        return "\n".join(lines)
+
+    def finish(self):
+        """Print the report and save the profile, if any."""
+        if not self.enabled:
+            return
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.profile_file)
+            pstats.Stats(self._profiler).sort_stats("cumulative").print_stats(15)
+            print(f"Saved profile to {self.profile_file}")
+            self._profiler = None
+        print(self.report())
+        return
+
+
+# The instrument every stage of the pipeline reports to
+instrument = Instrument(enabled=config.INSTRUMENT, profile_file=config.PROFILE_FILE)
@@ -1,22 +1,181 @@
 import datetime
+import json
+import multiprocessing
+import threading
+import weakref
+
+
+def format_entry(current_time, msg, fields, json_lines=False):
+    """Return the line written to the log file for a message."""
+    if json_lines:
+        record = {"time": current_time.isoformat(timespec="seconds"), "msg": msg}
+        record.update(fields)
+        return json.dumps(record, default=str) + "\n"
+    return current_time.strftime("%Y/%m/%d %H:%M:%S : ") + msg + "\n"
+
+
+def write_entries(file, buffer, json_lines):
+    """Write the buffered messages to file and empty the buffer."""
+    if buffer and not file.closed:
+        file.write("".join([format_entry(*entry, json_lines) for entry in buffer]))
+        file.flush()
+    buffer.clear()
+    return
+
+
+def close_file(file, buffer, json_lines):
+    """Write out what's left in the buffer and close the log file."""
+    write_entries(file, buffer, json_lines)
+    file.close()
+    return
+
+
+def flush_later(logger_ref):
+    """Flush a logger from its timer, unless it has been garbage
+    collected since.
+    """
+    logger = logger_ref()
+    if logger is not None:
+        logger.flush()
+    return
 
 
 class Logger:
-    def __init__(self, PATH, filename, erase_on_init=False):
+    def __init__(self, PATH, filename, erase_on_init=False, buffer_size=100,
+                 flush_interval=5.0, json_lines=False):
+        """Keep the log file open and write messages to it in batches,
+        once buffer_size messages are waiting or flush_interval seconds
+        after the first of them was logged. Whatever is left is written
+        when the logger is closed, garbage collected, or the program
+        exits. If json_lines is True, write each message as a json
+        object on its own line.
+
+        The logger can be shared by threads. Worker processes log
+        through the QueueLogger from queue_logger() instead.
+        """
         if PATH == "":
             self.output_file_path = filename
         else:
             self.output_file_path = f"{PATH}/{filename}"
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.json_lines = json_lines
 
-        # Open the file in write mode, which will erase it
+        # Open the file in write mode, which will erase it, or append
+        # mode to keep what's already there.
         if erase_on_init:
-            with open(self.output_file_path, "w") as file:
-                pass # Do nothing so the file is empty
+            self._file = open(self.output_file_path, "w")
+        else:
+            self._file = open(self.output_file_path, "a")
+        self._buffer = []
+        # Guards the buffer and file so threads can share the logger
+        self._lock = threading.Lock()
+        # Writes the buffer out flush_interval seconds after it starts
+        # filling, even if nothing else is logged
+        self._timer = None
+
+        # Set up by queue_logger() for worker processes
+        self._manager = None
+        self._queue = None
+        self._listener = None
+
+        # Close the file when the logger is garbage collected or the
+        # program exits, without keeping the logger alive until then
+        self._finalizer = weakref.finalize(self, close_file, self._file, self._buffer, json_lines)
+        return
+
+    def log(self, msg, **fields):
+        """Write a message to the log file. In json lines mode, any
+        keyword arguments are written as extra fields.
+
+        Raise a ValueError if the logger has been closed.
+        """
+        self._add(datetime.datetime.now(), msg, fields)
         return
 
-    def log(self, msg):
-        """Write a message to the log file"""
-        current_time = datetime.datetime.now()
-        with open(self.output_file_path, "a") as file:
-            file.write(current_time.strftime("%Y/%m/%d %H:%M:%S : ") + msg + "\n")
-        return
\ No newline at end of file
+    def _add(self, current_time, msg, fields):
+        """Buffer a message, writing the buffer out if it's full."""
+        with self._lock:
+            if self._file.closed:
+                raise ValueError(f"Can't log to {self.output_file_path}, the logger has been closed.")
+            self._buffer.append((current_time, msg, fields))
+            if len(self._buffer) >= self.buffer_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, flush_later, [weakref.ref(self)])
+                self._timer.daemon = True
+                self._timer.start()
+        return
+
+    def _flush(self):
+        """Write the buffer out. The caller must hold self._lock."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        write_entries(self._file, self._buffer, self.json_lines)
+        return
+
+    def flush(self):
+        """Write every buffered message to the log file now."""
+        with self._lock:
+            self._flush()
+        return
+
+    def queue_logger(self):
+        """Return a QueueLogger that worker processes can log through.
+        A thread in this process writes the messages they send to this
+        logger, until close() is called.
+        """
+        if self._queue is None:
+            self._manager = multiprocessing.Manager()
+            self._queue = self._manager.Queue()
+            self._listener = threading.Thread(target=self._listen, daemon=True)
+            self._listener.start()
+        return QueueLogger(self._queue)
+
+    def _listen(self):
+        """Move messages from worker processes into the buffer until
+        close() sends None.
+        """
+        while True:
+            try:
+                entry = self._queue.get()
+            except (EOFError, OSError):
+                return  # The manager has shut down
+            if entry is None:
+                return
+            self._add(*entry)
+
+    def close(self):
+        """Stop listening to worker processes, write out the buffer, and
+        close the log file.
+        """
+        if self._queue is not None:
+            try:
+                self._queue.put(None)
+                self._listener.join()
+                self._manager.shutdown()
+            except (EOFError, OSError):
+                pass  # The manager has already shut down
+            self._queue = None
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._finalizer()
+        return
+
+
+class QueueLogger:
+    """Stands in for a Logger inside worker processes, sending each
+    message back to the Logger that made it. Unlike a Logger, it can be
+    passed to a worker process.
+    """
+    def __init__(self, queue):
+        self._queue = queue
+        return
+
+    def log(self, msg, **fields):
+        """Send a message to be written to the log file."""
+        self._queue.put((datetime.datetime.now(), msg, fields))
+        return
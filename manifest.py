@@ -0,0 +1,58 @@
+"""Keep a record of the REPORT02.csv files that have already been
+accumulated, so that reports which haven't changed since the last run
+don't need to be read again.
+
+The manifest is a json file of the form
+    {"folders": {folder_name: {filename: entry, ...}, ...}}
+where each entry holds the report's path, size, mtime, and sha256.
+"""
+# Standard library imports
+import hashlib
+import json
+import os
+
+
+def hash_file(path):
+    """Return the sha256 hex digest of a file's contents."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def load_manifest(path):
+    """Return the manifest saved at path, or an empty manifest if there
+    isn't one yet.
+    """
+    try:
+        with open(path, "r") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {"folders": {}}
+
+
+def save_manifest(manifest, path):
+    """Save the manifest to path. Write to a temporary file first so an
+    interrupted run can't leave a half written manifest behind.
+    """
+    with open(f"{path}.tmp", "w") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+    return
+
+
+def report_entry(path, previous=None):
+    """Return the manifest entry for the report at path. The report is
+    only hashed if its size or mtime differ from the previous entry.
+
+    Raise FileNotFoundError if there is no report at path.
+    """
+    stat = os.stat(path)
+    if (previous is not None
+        and previous["size"] == stat.st_size
+        and previous["mtime"] == stat.st_mtime):
+        sha256 = previous["sha256"]
+    else:
+        sha256 = hash_file(path)
+    return {"path": path, "size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
@@ -0,0 +1,266 @@
+"""Call peaks in the raw chromatogram signals exported into each .D
+directory, instead of relying on the instrument's REPORT02.csv files.
+
+Each signal export is a csv file of retention time (minutes) and
+absorbance pairs. The trace is baseline corrected, smoothed, and split
+into peaks at its valleys, and each peak's area is integrated with the
+trapezoid rule, all in whole-trace NumPy operations. The peaks of every
+raw data folder are saved to an acc_ file in the same FileName, PeakNum,
+RetTime, and Area columns accumulate_reports.py writes, so
+generate_dataset.py can build a dataset from them. Runs are called in a
+pool of worker processes.
+
+Run from the repository root:
+    python peak_calling.py
+"""
+# Standard library imports
+import codecs
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Third party imports
+import pandas as pd
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Import from our app
+from accumulate_reports import save_folder
+from instrument import instrument
+from logger import Logger
+from report02 import COLUMNS
+from storage import check_storage_format
+import config
+
+
+def read_signal(path):
+    """Return the retention times and absorbances in a signal export as
+    two float arrays. The export may be UTF-16, like the reports, or
+    UTF-8, and any header lines are skipped.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        text = data.decode("utf-16")
+    else:
+        text = data.decode("utf-8-sig")
+    df = pd.read_csv(io.StringIO(text), header=None, usecols=[0, 1])
+    # Header lines don't parse as numbers, drop them
+    values = df.apply(pd.to_numeric, errors="coerce").dropna().to_numpy(dtype=float)
+    return values[:, 0], values[:, 1]
+
+
+def _pad(values, width):
+    """Return values padded with copies of its ends, so a window of
+    width centered on each point stays inside the array.
+    """
+    return np.pad(values, (width // 2, width - 1 - width // 2), mode="edge")
+
+
+def moving_average(values, width):
+    """Return the mean of the width points centered on each point."""
+    if width <= 1:
+        return values.copy()
+    return np.convolve(_pad(values, width), np.ones(width) / width, mode="valid")
+
+
+def estimate_baseline(values, width):
+    """Return the baseline under a trace: the lowest the trace gets
+    within width points, raised back up to the highest of those minimums
+    so slow drift is followed, and smoothed. Peaks narrower than width
+    points are cut out of the baseline.
+    """
+    if width <= 1:
+        return np.zeros_like(values)
+    minimums = sliding_window_view(_pad(values, width), width).min(axis=1)
+    opened = sliding_window_view(_pad(minimums, width), width).max(axis=1)
+    return moving_average(opened, width)
+
+
+def find_peaks(values, min_height):
+    """Return the index of the apex, start, and end of every peak in a
+    baseline corrected trace that is at least min_height tall.
+
+    An apex is a point higher than the one before it and at least as
+    high as the one after. A valley is a point lower than the one before
+    it and at most as high as the one after, so the flat top of a
+    saturated peak is never taken for one. Each peak starts and ends at
+    the nearest valley, point back at the baseline, or end of the trace
+    on either side of its apex.
+    """
+    if len(values) < 3:
+        empty = np.array([], dtype=int)
+        return empty, empty, empty
+    middle = values[1:-1]
+    apexes = np.flatnonzero((middle > values[:-2]) & (middle >= values[2:])
+                            & (middle >= min_height)) + 1
+    valleys = np.flatnonzero(((middle < values[:-2]) & (middle <= values[2:]))
+                             | (middle <= 0)) + 1
+    bounds = np.concatenate([[0], valleys, [len(values) - 1]])
+    after = np.searchsorted(bounds, apexes, side="right")
+    return apexes, bounds[after - 1], bounds[after]
+
+
+def integrate_peaks(times, values, starts, ends):
+    """Return the area of each peak between its start and end index,
+    integrated with the trapezoid rule over times in seconds.
+    """
+    seconds = times * 60
+    trapezoids = (values[1:] + values[:-1]) / 2 * np.diff(seconds)
+    cumulative = np.concatenate([[0.0], np.cumsum(trapezoids)])
+    return cumulative[ends] - cumulative[starts]
+
+
+def call_peaks(times, values, smooth_width=config.PEAK_SMOOTH_WIDTH,
+               baseline_window=config.PEAK_BASELINE_WINDOW,
+               min_height=config.PEAK_MIN_HEIGHT):
+    """Return the peak numbers, retention times, and areas of the peaks
+    in a trace as three lists of strings, like parse_report02().
+
+    smooth_width is the number of points averaged to smooth the trace,
+    baseline_window the width in minutes of the widest peak the baseline
+    should cut out, and min_height the smallest peak height kept, in the
+    trace's units.
+    """
+    if len(times) < 3:
+        return [], [], []
+    # Convert the baseline window from minutes to points
+    spacing = np.median(np.diff(times))
+    window = max(int(round(baseline_window / spacing)), 1) if spacing > 0 else 1
+
+    corrected = values - estimate_baseline(values, window)
+    smoothed = moving_average(corrected, smooth_width)
+    apexes, starts, ends = find_peaks(smoothed, min_height)
+    areas = integrate_peaks(times, corrected, starts, ends)
+
+    # Peaks left with no area after baseline correction aren't peaks
+    keep = areas > 0
+    ret_times = times[apexes[keep]]
+    areas = areas[keep]
+    peak_nums = [str(peak_num) for peak_num in range(1, len(areas) + 1)]
+    return (peak_nums,
+            [f"{ret_time:.3f}" for ret_time in ret_times],
+            [f"{area:.4f}" for area in areas])
+
+
+def call_run_task(raw_input_folder, folder_name, filename, signal_filename,
+                  smooth_width, baseline_window, min_height):
+    """Call the peaks in one run's signal export, see call_peaks(). Return
+    the peak columns, or an error message if the export couldn't be
+    read, along with the stages recorded while it ran.
+    """
+    signal_path = f"{raw_input_folder}/{folder_name}/{filename}/{signal_filename}"
+    result = None
+    message = None
+    try:
+        with instrument.stage("read signal", item=signal_path) as stage:
+            times, values = read_signal(signal_path)
+            stage.rows = len(times)
+        with instrument.stage("call peaks", item=signal_path) as stage:
+            result = call_peaks(times, values, smooth_width, baseline_window, min_height)
+            stage.rows = len(result[0])
+    except FileNotFoundError:
+        message = f"There was no signal file for {raw_input_folder}/{folder_name}/{filename}."
+    except (ValueError, IndexError, pd.errors.ParserError) as e:
+        message = f"Could not read the signal file for {raw_input_folder}/{folder_name}/{filename}: {e}"
+    return result, message, instrument.take_stages()
+
+
+def call_folders(raw_input_folder, processed_input_folder, workers=None,
+                 storage_format="csv", logger=None,
+                 signal_filename=config.SIGNAL_FILENAME,
+                 smooth_width=config.PEAK_SMOOTH_WIDTH,
+                 baseline_window=config.PEAK_BASELINE_WINDOW,
+                 min_height=config.PEAK_MIN_HEIGHT):
+    """Call the peaks in the signal_filename export of every .D directory
+    in every raw data folder in raw_input_folder, and save each folder's
+    peaks to an acc_ file in processed_input_folder. Runs are called by
+    up to workers processes at once, or one per CPU if workers is None.
+    See call_peaks() for the other arguments. Return the names of the
+    folders saved.
+    """
+    check_storage_format(storage_format)
+    # Log to log.txt unless the caller has a logger
+    own_logger = logger is None
+    if own_logger:
+        logger = Logger("", "log.txt")
+
+    RIF = raw_input_folder
+    if not os.path.exists(RIF):
+        raise OSError("RawInput folder not found. Please ensure it exists in your path and is named correctly.")
+    PIF = processed_input_folder
+    if not os.path.exists(PIF):
+        print(f"{PIF} directory did not exist: Created {PIF}.")
+        os.mkdir(PIF)
+
+    # Every run in every folder, so the pool stays busy even when the
+    # folders hold different numbers of runs.
+    raw_data_folders = [folder for folder in os.listdir(RIF)
+                        if len(folder.split(".")) == 1]
+    folder_filenames = {folder_name: [filename for filename in sorted(os.listdir(f"{RIF}/{folder_name}"))
+                                      if filename[-2:] == ".D"]
+                        for folder_name in raw_data_folders}
+    runs = [(folder_name, filename)
+            for folder_name in raw_data_folders
+            for filename in folder_filenames[folder_name]]
+    print(f"Calling peaks in {len(runs)} runs from {len(raw_data_folders)} folders")
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    # map() hands the results back in run order, so the folders come back
+    # one after another
+    results = executor.map(call_run_task,
+                           [RIF] * len(runs),
+                           [folder_name for folder_name, _ in runs],
+                           [filename for _, filename in runs],
+                           [signal_filename] * len(runs),
+                           [smooth_width] * len(runs),
+                           [baseline_window] * len(runs),
+                           [min_height] * len(runs),
+                           chunksize=16)
+
+    # Save each folder as soon as its last run comes back. Folders
+    # without any runs are still counted, and reported as empty.
+    saved_folders = []
+    folder_counter = 1
+    for folder_name in raw_data_folders:
+        columns = {column: [] for column in COLUMNS}
+        for filename in folder_filenames[folder_name]:
+            result, message, stages = next(results)
+            instrument.merge(stages)
+            if message is not None:
+                logger.log(message)
+                continue
+            peak_nums, ret_times, areas = result
+            columns["FileName"].extend([filename] * len(peak_nums))
+            columns["PeakNum"].extend(peak_nums)
+            columns["RetTime"].extend(ret_times)
+            columns["Area"].extend(areas)
+        print(f"Finished folder {folder_counter}/{len(raw_data_folders)} {folder_name}")
+        if save_folder(pd.DataFrame(columns), PIF, folder_name, storage_format):
+            saved_folders.append(folder_name)
+        folder_counter += 1
+    executor.shutdown()
+
+    if own_logger:
+        logger.close()
+    return saved_folders
+
+
+def main():
+    instrument.start()
+    # Create an object to log errors that occur
+    logger = Logger("", "log.txt", erase_on_init=True, json_lines=config.LOG_JSON_LINES)
+    call_folders(config.RAW_INPUT_FOLDER,
+                 config.CALLED_INPUT_FOLDER,
+                 workers=config.PEAK_CALLING_WORKERS,
+                 storage_format=config.STORAGE_FORMAT,
+                 logger=logger)
+    logger.close()
+    instrument.finish()
+    return
+
+
+# Guard the script so worker processes can import this module without
+# re-running it.
+if __name__ == "__main__":
+    main()
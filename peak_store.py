@@ -0,0 +1,184 @@
+"""Keep every accumulated peak in a local SQLite database, along with the
+chemical and sample meta data, so questions about the peaks can be
+answered with indexed queries instead of re-running the pipeline.
+
+accumulate_reports.py loads the peaks when PEAK_DATABASE is set in
+config.py. Query them from the repository root:
+    python peak_store.py --between 12.2 12.8
+    python peak_store.py --accession Rutin_Standard
+"""
+# Standard library imports
+import argparse
+import os
+import sqlite3
+
+# Third party imports
+import pandas as pd
+
+# Import from our app
+import config
+
+
+# Tables made when a database is first opened. parent_directory is the
+# folder name that samples are listed under in the super meta data.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS peaks (
+    folder TEXT NOT NULL,
+    parent_directory TEXT NOT NULL,
+    file TEXT NOT NULL,
+    peak_num INTEGER,
+    ret_time REAL,
+    area REAL
+);
+CREATE INDEX IF NOT EXISTS peaks_sample ON peaks (parent_directory, file);
+CREATE INDEX IF NOT EXISTS peaks_folder ON peaks (folder);
+CREATE INDEX IF NOT EXISTS peaks_ret_time ON peaks (ret_time);
+"""
+
+# Take the largest area of each chemical in each sample. A peak in more
+# than one range belongs to whichever range comes first in the chemical
+# meta data, the same as ChemRanges.lookup().
+DATASET_QUERY = """
+WITH first_match AS (
+    SELECT p.rowid AS peak_row, MIN(c.rowid) AS chem_row
+    FROM chemmeta AS c
+    JOIN peaks AS p ON p.ret_time BETWEEN c.BeginRetTime AND c.EndRetTime
+    GROUP BY p.rowid
+)
+SELECT p.folder, p.parent_directory, p.file, c.ChemicalID, MAX(p.area)
+FROM first_match AS m
+JOIN peaks AS p ON p.rowid = m.peak_row
+JOIN chemmeta AS c ON c.rowid = m.chem_row
+WHERE p.area > -1
+GROUP BY p.folder, p.parent_directory, p.file, c.ChemicalID
+"""
+
+# Every sample, in the order its first peak was stored. Folders X and
+# XNew share a parent directory but keep their own samples.
+SAMPLES_QUERY = """
+SELECT folder, parent_directory, file
+FROM peaks
+GROUP BY folder, parent_directory, file
+ORDER BY MIN(rowid)
+"""
+
+
+def connect(db_file):
+    """Open the database in db_file, making its tables if they don't
+    exist yet.
+    """
+    conn = sqlite3.connect(db_file)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def stored_folders(conn):
+    """Return a set of the raw data folders with peaks in the database."""
+    return {row[0] for row in conn.execute("SELECT DISTINCT folder FROM peaks")}
+
+
+def sql_numbers(values):
+    """Return values as a list of numbers for SQLite. Anything that isn't
+    a number, like an empty field, becomes None and is stored as NULL,
+    the same as read_csv() would make it NaN.
+    """
+    numbers = pd.to_numeric(pd.Series(values), errors="coerce")
+    return numbers.astype(object).where(numbers.notna(), None).tolist()
+
+
+def store_folder(conn, folder_name, folder_df):
+    """Replace the peaks stored for a raw data folder with the rows of
+    its accumulated DataFrame.
+    """
+    # Samples are listed under the folder name without New, the same
+    # as get_parent_directory() gives for the folder's acc_ file
+    parent_directory = folder_name.replace("New", "")
+    rows = zip([folder_name] * len(folder_df.index),
+               [parent_directory] * len(folder_df.index),
+               folder_df["FileName"].tolist(),
+               sql_numbers(folder_df["PeakNum"].values),
+               sql_numbers(folder_df["RetTime"].values),
+               sql_numbers(folder_df["Area"].values))
+    with conn:
+        conn.execute("DELETE FROM peaks WHERE folder = ?", (folder_name,))
+        conn.executemany("INSERT INTO peaks VALUES (?, ?, ?, ?, ?, ?)", rows)
+    return
+
+
+def store_table(conn, table_name, df):
+    """Replace a table with the rows of a DataFrame, kept in order."""
+    with conn:
+        df.to_sql(table_name, conn, if_exists="replace", index=False)
+    return
+
+
+def store_meta_tables(conn, chem_meta_file, super_meta_file):
+    """Replace the chemmeta and supermeta tables with the contents of
+    the chemical and sample meta data files.
+    """
+    store_table(conn, "chemmeta", pd.read_csv(chem_meta_file))
+    store_table(conn, "supermeta", pd.read_csv(super_meta_file))
+    return
+
+
+def chem_areas(conn):
+    """Return every sample with stored peaks, in the order its first
+    peak was stored, and the largest area of each chemical in each
+    sample, found by matching the stored peaks to the chemmeta table in
+    one query.
+    """
+    sample_keys = ["Folder", "ParentDirectory", "FileName"]
+    samples = pd.DataFrame(conn.execute(SAMPLES_QUERY).fetchall(), columns=sample_keys)
+    areas_df = pd.DataFrame(conn.execute(DATASET_QUERY).fetchall(),
+                            columns=sample_keys + ["ChemicalID", "Area"])
+    return samples, areas_df
+
+
+def samples_with_peak(conn, begin, end):
+    """Return every peak with a retention time between begin and end,
+    ends included, along with the sample it came from.
+    """
+    return pd.read_sql("SELECT parent_directory, file, peak_num, ret_time, area "
+                       "FROM peaks WHERE ret_time BETWEEN ? AND ? "
+                       "ORDER BY parent_directory, file, ret_time",
+                       conn, params=(begin, end))
+
+
+def accession_peaks(conn, accession):
+    """Return every peak from the samples of an accession, across all
+    of the runs it was in.
+    """
+    return pd.read_sql("SELECT p.parent_directory, p.file, p.peak_num, p.ret_time, p.area "
+                       "FROM supermeta AS s "
+                       "JOIN peaks AS p ON p.parent_directory = s.FolderName AND p.file = s.HPLCdatafilename "
+                       "WHERE s.AccessionName = ? "
+                       "ORDER BY p.parent_directory, p.file, p.ret_time",
+                       conn, params=(accession,))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the peaks stored in PEAK_DATABASE.")
+    parser.add_argument("--between", nargs=2, type=float, metavar=("BEGIN", "END"),
+                        help="list the peaks with a retention time in this range")
+    parser.add_argument("--accession", help="list the peaks of every sample of this accession")
+    args = parser.parse_args()
+
+    if config.PEAK_DATABASE is None or not os.path.exists(config.PEAK_DATABASE):
+        print("No peak database found. Set PEAK_DATABASE in config.py and run accumulate_reports.py.")
+        return
+    conn = connect(config.PEAK_DATABASE)
+    # Query against the current sample meta data
+    if os.path.exists(config.SUPER_META_FILE):
+        store_table(conn, "supermeta", pd.read_csv(config.SUPER_META_FILE))
+
+    with pd.option_context("display.max_rows", None):
+        if args.between is not None:
+            print(samples_with_peak(conn, *args.between))
+        if args.accession is not None:
+            print(accession_peaks(conn, args.accession))
+    conn.close()
+    return
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Read the peak table out of the REPORT02.csv files that the HPLC
+writes into each .D directory of a run.
+
+Each report is read from disk in one call. When the peaks are wanted
+as numbers, the report is decoded in one call, its line and field
+boundaries are checked with NumPy, and pandas' C parser turns the
+PeakNum, RetTime, and Area columns straight into typed arrays, so no
+Python code runs per line. Reports that parser can't be trusted to read
+the same way as parse_report02(), like ones with short lines or stray
+carriage returns, and reports whose peaks are wanted as text go through
+parse_report02(). Decoding and parsing are timed as separate stages.
+"""
+# Standard library imports
+import codecs
+import csv
+import io
+
+# Third party imports
+import pandas as pd
+import numpy as np
+
+# Import from our app
+from instrument import instrument
+
+# Name of the report file found inside each .D directory
+REPORT_FILENAME = "REPORT02.csv"
+
+# Columns of the DataFrames built from report files
+COLUMNS = ["FileName", "PeakNum", "RetTime", "Area"]
+
+# Positions of the peak number, retention time, and area in each line
+REPORT_FIELDS = [0, 1, 4]
+
+# Types of the peak number, retention time, and area when they are read
+# as numbers
+REPORT_DTYPES = {0: "int64", 1: "float64", 4: "float64"}
+
+# Code units of the characters looked for in a report
+NEWLINE = ord("\n")
+CARRIAGE_RETURN = ord("\r")
+COMMA = ord(",")
+
+
+def parse_report02(lines, path):
+    """Return the peak numbers, retention times, and areas in the lines
+    of a REPORT02.csv file as three lists of strings.
+
+    Raise a ValueError naming the line if a line has too few fields.
+    """
+    peak_nums = []
+    ret_times = []
+    areas = []
+    for line_num, line in enumerate(lines, start=1):
+        # Only the first five fields matter, leave the rest unsplit
+        fields = line.split(",", 5)
+        if len(fields) < 5:
+            raise ValueError(f"Line {line_num} of {path} has {len(fields)} fields, expected at least 5.")
+        peak_nums.append(fields[0])
+        ret_times.append(fields[1])
+        areas.append(fields[4])
+    return peak_nums, ret_times, areas
+
+
+def detect_encoding(data):
+    """Return the encoding of the bytes of a report, the length of its
+    byte order mark, and the NumPy type of one of its code units.
+
+    Reports without a byte order mark are taken to be UTF-16 if they hold
+    null bytes, little endian if those come second in each pair, and
+    UTF-8 otherwise.
+    """
+    if data.startswith(codecs.BOM_UTF16_LE):
+        return "utf-16-le", len(codecs.BOM_UTF16_LE), "<u2"
+    if data.startswith(codecs.BOM_UTF16_BE):
+        return "utf-16-be", len(codecs.BOM_UTF16_BE), ">u2"
+    if data.startswith(codecs.BOM_UTF8):
+        return "utf-8", len(codecs.BOM_UTF8), "u1"
+    if b"\x00" in data[:512]:
+        if data[1:512:2].count(0) >= data[0:512:2].count(0):
+            return "utf-16-le", 0, "<u2"
+        return "utf-16-be", 0, ">u2"
+    return "utf-8", 0, "u1"
+
+
+def check_report02(data, encoding, offset, unit):
+    """Return the decoded text of the bytes of a report, the number of
+    fields in its longest line, and its number of lines, or None if the
+    report has to be read by parse_report02() to give the same result.
+
+    Commas and line breaks are single code units in every encoding a
+    report can have, so the report's fields are counted on its raw code
+    units before anything is decoded.
+    """
+    if (len(data) - offset) % np.dtype(unit).itemsize != 0:
+        return None
+    units = np.frombuffer(data, dtype=unit, offset=offset)
+    if len(units) == 0 or np.any(units == 0):
+        return None
+
+    # A carriage return is only safe as part of a Windows line break,
+    # anywhere else it would start a new line
+    carriage_returns = np.flatnonzero(units == CARRIAGE_RETURN)
+    if len(carriage_returns) > 0:
+        if carriage_returns[-1] == len(units) - 1:
+            return None
+        if np.any(units[carriage_returns + 1] != NEWLINE):
+            return None
+
+    # The area is only its own field if every line has at least six
+    newlines = np.flatnonzero(units == NEWLINE)
+    if units[-1] != NEWLINE:
+        newlines = np.append(newlines, len(units))
+    starts = np.concatenate([[0], newlines[:-1] + 1])
+    commas = np.flatnonzero(units == COMMA)
+    n_commas = np.searchsorted(commas, newlines) - np.searchsorted(commas, starts)
+    if np.any(n_commas < 5):
+        return None
+
+    try:
+        text = data[offset:].decode(encoding)
+    except UnicodeDecodeError:
+        return None
+    return text, int(n_commas.max()) + 1, len(newlines)
+
+
+def split_report02(text, n_fields, n_lines):
+    """Return the peak numbers, retention times, and areas in the text
+    of a report that passed check_report02() as three arrays of numbers,
+    or None if they aren't all numbers.
+    """
+    try:
+        # Name every field so lines may have different numbers of them,
+        # and keep quotes as they are like str.split() does
+        df = pd.read_csv(io.StringIO(text), header=None, names=range(n_fields),
+                         usecols=REPORT_FIELDS, dtype=REPORT_DTYPES, na_filter=False,
+                         quoting=csv.QUOTE_NONE, skip_blank_lines=False, engine="c")
+    except (ValueError, pd.errors.ParserError):
+        return None
+    if len(df.index) != n_lines:
+        return None
+    return tuple(df[field].to_numpy() for field in REPORT_FIELDS)
+
+
+def decode_lines(data, encoding, offset):
+    """Return the lines of the bytes of a report, with newlines
+    translated the same way open() does.
+    """
+    return io.TextIOWrapper(io.BytesIO(data[offset:]), encoding=encoding).readlines()
+
+
+def read_report02(path, as_text=True):
+    """Return the peak numbers, retention times, and areas in a
+    REPORT02.csv file, as three lists of strings if as_text is True and
+    as three arrays of numbers otherwise.
+
+    Raise a ValueError if the report can't be decoded, a line has too
+    few fields, or a field that should be a number isn't one.
+    """
+    with instrument.stage("decode report", item=path) as stage:
+        # One read of the whole file, which on a network share is much
+        # faster than reading it a block at a time
+        with open(path, "rb") as file:
+            data = file.read()
+        encoding, offset, unit = detect_encoding(data)
+        checked = None if as_text else check_report02(data, encoding, offset, unit)
+        if checked is None:
+            lines = decode_lines(data, encoding, offset)
+            stage.rows = len(lines)
+        else:
+            stage.rows = checked[2]
+
+    with instrument.stage("parse report", item=path) as stage:
+        columns = None if checked is None else split_report02(*checked)
+        if columns is None:
+            if checked is not None:
+                # The fast parser gave up, read it the slow way
+                lines = decode_lines(data, encoding, offset)
+            columns = parse_report02(lines, path)
+            if not as_text:
+                columns = tuple(pd.to_numeric(pd.Series(column, dtype=object)).to_numpy()
+                                for column in columns)
+        stage.rows = len(columns[0])
+    return columns
@@ -0,0 +1,185 @@
+"""Go straight from the REPORT02.csv files in the raw data folders to the
+final dataset, without writing and re-reading the acc_ files in
+ProcessedInput. Each folder's reports are parsed, matched to chemicals,
+and reduced to one row per sample before the next folder is read, so
+only one folder's peaks are held in memory at a time.
+
+Run with --write-processed to also save each folder's acc_ file, the
+same as accumulate_reports.py would, for auditing.
+"""
+# Standard library imports
+import argparse
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Third party imports
+import pandas as pd
+
+# Import from our app
+from accumulate_reports import accumulate_folder_task, save_folder
+from generate_dataset import (build_dataset, get_parent_directory, load_chem_ranges,
+                              load_meta_index, save_dataset)
+from instrument import instrument
+from logger import Logger
+from storage import check_storage_format
+import config
+
+
+def folder_peaks(folder_df, folder_name):
+    """Return the retention times and areas of a folder's accumulated
+    rows as numbers, along with the folder, parent directory, and file
+    name of the sample each peak came from, like load_processed_peaks()
+    reads them from the folder's acc_ file.
+    """
+    peaks_df = pd.DataFrame({
+        "Folder": folder_name,
+        "ParentDirectory": get_parent_directory(f"acc_{folder_name}.csv"),
+        "FileName": folder_df["FileName"].values,
+        # A value that isn't a number becomes NaN, as read_csv() would
+        # make it, instead of stopping the run
+        "RetTime": pd.to_numeric(folder_df["RetTime"], errors="coerce").to_numpy(dtype=float),
+        "Area": pd.to_numeric(folder_df["Area"], errors="coerce").to_numpy(dtype=float),
+    })
+    return peaks_df
+
+
+def folder_results(executor, raw_input_folder, raw_data_folders, window):
+    """Yield the results of accumulate_folder_task() for each raw data
+    folder in order, read by executor. At most window folders are
+    submitted ahead of the one being yielded, so only that many folders'
+    rows are ever held in memory.
+    """
+    pending = deque()
+    folder_names = iter(raw_data_folders)
+    while True:
+        # Keep window folders submitted ahead of the one being yielded
+        while len(pending) < window:
+            folder_name = next(folder_names, None)
+            if folder_name is None:
+                break
+            pending.append(executor.submit(accumulate_folder_task, raw_input_folder, folder_name, False))
+        if not pending:
+            return
+        yield pending.popleft().result()
+
+
+def run_pipeline(raw_input_folder, chem_meta_file, super_meta_file, output_folder,
+                 processed_input_folder=None, workers=1, logger=None, storage_format="csv"):
+    """Build the final dataset from the REPORT02.csv files in every raw
+    data folder in raw_input_folder and save it in output_folder. Return
+    the path it was saved to, or None if there was no data to save.
+
+    If processed_input_folder is given, each folder's acc_ file is also
+    saved there. Both are stored in storage_format. Folders are read by
+    up to workers processes at once. Errors are logged to logger, or to
+    log.txt if there isn't one.
+    """
+    check_storage_format(storage_format)
+    # Log to log.txt unless the caller has a logger
+    own_logger = logger is None
+    if own_logger:
+        logger = Logger("", "log.txt")
+
+    # RIF stands for raw input folder
+    RIF = raw_input_folder
+    if not os.path.exists(RIF):
+        raise OSError("RawInput folder not found. Please ensure it exists in your path and is named correctly.")
+
+    # PIF stands for processed input folder, OF for output folder
+    PIF = processed_input_folder
+    OF = output_folder
+    for folder in [PIF, OF]:
+        if folder is not None and not os.path.exists(folder):
+            print(f"{folder} directory did not exist: Created {folder}.")
+            os.mkdir(folder)
+
+    # Get the chemical and sample meta data before reading any reports
+    chem_ranges, chem_columns = load_chem_ranges(chem_meta_file)
+    meta_index, meta_columns = load_meta_index(super_meta_file, logger)
+
+    # Get a list of all the raw data folders. Parse non-folders by excluding
+    # anything with a file extension.
+    raw_data_folders = [folder for folder in os.listdir(RIF)
+                        if len(folder.split(".")) == 1]
+
+    if workers > 1:
+        # Read the folders in worker processes. The results come back in
+        # folder order, so the dataset matches a serial run, and only a
+        # couple of folders per worker are read ahead of the one being
+        # finished.
+        print(f"Processing {len(raw_data_folders)} folders with {workers} workers")
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = folder_results(executor, RIF, raw_data_folders, 2 * workers)
+    else:
+        executor = None
+        results = (accumulate_folder_task(RIF, folder_name)
+                   for folder_name in raw_data_folders)
+
+    # Only the finished rows of each folder are kept, its peaks are
+    # dropped before the next folder is read.
+    output_dfs = []
+    folder_counter = 1
+    # Stop the workers even if a folder fails, instead of leaving them
+    # running
+    try:
+        for folder_name, (result, stages) in zip(raw_data_folders, results):
+            folder_df, _, messages, _ = result
+            instrument.merge(stages)
+            print(f"Finished folder {folder_counter}/{len(raw_data_folders)} {folder_name}")
+            for msg in messages:
+                logger.log(msg)
+            if PIF is not None:
+                save_folder(folder_df, PIF, folder_name, storage_format)
+            if len(folder_df.index) > 0:
+                with instrument.stage("finalize folder", item=folder_name, rows=len(folder_df.index)):
+                    peaks_df = folder_peaks(folder_df, folder_name)
+                    output_dfs.append(build_dataset(peaks_df, chem_ranges, chem_columns,
+                                                    meta_index, meta_columns, logger))
+            del folder_df
+
+            # Update the folder counter
+            folder_counter += 1
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    if len(output_dfs) > 0:
+        output_df = pd.concat(output_dfs, ignore_index=True)
+    else:
+        output_df = pd.DataFrame(columns=(meta_columns + chem_columns))
+    output_path = save_dataset(output_df, OF, storage_format)
+    if own_logger:
+        logger.close()
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the final dataset straight from the raw data folders.")
+    parser.add_argument("--write-processed", action="store_true",
+                        help="also save each folder's acc_ file in the processed input folder")
+    args = parser.parse_args()
+
+    instrument.start()
+    # Create an object to log errors that occur
+    logger = Logger("", "log.txt", erase_on_init=True, json_lines=config.LOG_JSON_LINES)
+    try:
+        run_pipeline(config.RAW_INPUT_FOLDER,
+                     config.CHEM_META_FILE,
+                     config.SUPER_META_FILE,
+                     config.OUTPUT_FOLDER,
+                     processed_input_folder=config.PROCESSED_INPUT_FOLDER if args.write_processed else None,
+                     workers=config.ACCUMULATE_WORKERS,
+                     logger=logger,
+                     storage_format=config.STORAGE_FORMAT)
+    except FileNotFoundError as e:
+        print(e)
+    logger.close()
+    instrument.finish()
+    return
+
+
+# Guard the script so worker processes can import this module without
+# re-running it.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Read and write the processed acc_ files and the final dataset as csv,
+Parquet, or Feather. Parquet and Feather need pyarrow, which is only
+imported when one of them is used.
+
+The columnar formats store the peak columns with explicit types, so
+they are read back without any type inference: FileName is a category,
+PeakNum an integer, and RetTime and Area 64 bit floats. Retention times
+are kept at full precision because the chemical ranges include their
+end points, and rounding them to 32 bits would move peaks that sit
+exactly on a boundary.
+"""
+# Third party imports
+import pandas as pd
+
+# File extension used for each storage format
+STORAGE_FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+# Types the peak columns are stored with in the columnar formats
+PEAK_DTYPES = {"FileName": "category", "PeakNum": "int32", "RetTime": "float64", "Area": "float64"}
+
+
+def check_storage_format(storage_format):
+    """Raise a ValueError if storage_format isn't known, or an ImportError
+    if it needs pyarrow and pyarrow isn't installed.
+    """
+    if storage_format not in STORAGE_FORMATS:
+        raise ValueError(f"Unknown storage format '{storage_format}', expected one of {', '.join(STORAGE_FORMATS)}.")
+    if storage_format != "csv":
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError(f"The {storage_format} storage format needs pyarrow. Install it with 'pip install pyarrow' or set STORAGE_FORMAT to \"csv\" in config.py.")
+    return
+
+
+def is_stored_file(filename, storage_format):
+    """Return whether filename has the extension of storage_format."""
+    return filename.endswith(STORAGE_FORMATS[storage_format])
+
+
+def processed_filename(folder_name, storage_format):
+    """Return the name of the acc_ file a raw data folder is saved to."""
+    return f"acc_{folder_name}{STORAGE_FORMATS[storage_format]}"
+
+
+def typed_peaks(folder_df):
+    """Return a copy of an accumulated DataFrame of strings with each
+    peak column converted to its stored type.
+    """
+    typed_df = folder_df.copy()
+    for column, dtype in PEAK_DTYPES.items():
+        if column in typed_df.columns:
+            if dtype == "category":
+                typed_df[column] = typed_df[column].astype(dtype)
+            else:
+                typed_df[column] = pd.to_numeric(typed_df[column]).astype(dtype)
+    return typed_df
+
+
+def text_columns(df):
+    """Return a copy of a dataset with every object column made up of
+    strings only. Columnar formats need one type per column, but a
+    column like Sort# holds numbers for samples in the super meta data
+    and "na" for the rest.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype == object:
+            df[column] = df[column].astype(str)
+    return df
+
+
+def write_table(df, path, storage_format):
+    """Write a DataFrame to path in storage_format, without its index."""
+    if storage_format == "parquet":
+        df.to_parquet(path, index=False)
+    elif storage_format == "feather":
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_csv(path, index=False, index_label=False)
+    return
+
+
+def read_table(path, storage_format, columns=None, as_text=False):
+    """Read a DataFrame written by write_table(), keeping only the given
+    columns. If as_text is True, every value is read as a string.
+    """
+    if storage_format == "parquet":
+        df = pd.read_parquet(path, columns=columns)
+    elif storage_format == "feather":
+        df = pd.read_feather(path, columns=columns)
+    elif as_text:
+        # Read everything as strings so the values come back exactly as
+        # they were written
+        return pd.read_csv(path, usecols=columns, dtype=str, keep_default_na=False)
+    else:
+        return pd.read_csv(path, usecols=columns)
+    if as_text:
+        df = df.astype(str)
+    return df
@@ -0,0 +1,119 @@
+"""Build the chemical meta data for a grid of BUCKET_MARGIN, MIN_RANGE,
+MAX_RANGE, and DELETE_AMBIG values, and summarize how many C, PP, and
+CPP ranges each setting gives and how many library peaks they cover.
+
+Example:
+    python sweep_chemmeta.py --margins 0.05 0.1 0.2 --max-ranges 1.0 1.3 --workers 4
+"""
+# Standard library imports
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Third party imports
+import numpy as np
+import pandas as pd
+
+# Import from our app
+from chem_ranges import ChemRanges
+from generate_chemmeta import build_chemmeta, count_labels, load_peaks_txt
+import config
+
+
+# The peak libraries, loaded once by the main process and handed to
+# each worker process once when it starts.
+_libraries = {}
+
+
+def load_libraries(card_peaks, pp_peaks):
+    """Store the peak libraries for evaluate_setting() to use."""
+    _libraries["card"] = card_peaks
+    _libraries["pp"] = pp_peaks
+    return
+
+
+def coverage(peaks, chem_ranges):
+    """Return the fraction of unique peaks that fall in a range."""
+    unique_peaks = np.unique(peaks)
+    if len(unique_peaks) == 0:
+        return np.nan
+    return float(np.mean(chem_ranges.lookup(unique_peaks) != None))
+
+
+def evaluate_setting(setting, write_folder=None):
+    """Build the chemical meta data for one (margin, min_range,
+    max_range, delete_ambig) setting and return its summary row. If
+    write_folder is given, also save the chemical meta data there.
+    """
+    margin, min_range, max_range, delete_ambig = setting
+    row = {"BucketMargin": margin, "MinRange": min_range,
+           "MaxRange": max_range, "DeleteAmbig": delete_ambig}
+    try:
+        df = build_chemmeta(_libraries["card"], _libraries["pp"], margin,
+                            min_range, max_range, delete_ambig, verbose=False)
+    except ValueError as e:
+        # resolve_overlaps() gives up on some overlaps, note it and move
+        # on to the next setting
+        row["Error"] = str(e)
+        return row
+
+    row["C"], row["PP"], row["CPP"] = count_labels(df)
+    chem_ranges = ChemRanges(df.reset_index())
+    row["CardCoverage"] = coverage(_libraries["card"], chem_ranges)
+    row["PPCoverage"] = coverage(_libraries["pp"], chem_ranges)
+
+    if write_folder is not None:
+        df.to_csv(f"{write_folder}/chemmeta_{margin}_{min_range}_{max_range}_Ambig{not delete_ambig}.csv")
+    return row
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep the chemical meta data settings.")
+    parser.add_argument("--margins", type=float, nargs="+", default=[config.BUCKET_MARGIN],
+                        help="BUCKET_MARGIN values to try")
+    parser.add_argument("--min-ranges", type=float, nargs="+", default=[config.MIN_RANGE],
+                        help="MIN_RANGE values to try")
+    parser.add_argument("--max-ranges", type=float, nargs="+", default=[config.MAX_RANGE],
+                        help="MAX_RANGE values to try")
+    parser.add_argument("--delete-ambig", choices=["True", "False"], nargs="+",
+                        default=[str(config.DELETE_AMBIG)],
+                        help="DELETE_AMBIG values to try")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes")
+    parser.add_argument("--summary", default=f"{config.OUTPUT_FOLDER}/chemmeta_sweep.csv",
+                        help="where to save the summary table")
+    parser.add_argument("--write-folder", default=None,
+                        help="also save every setting's chemical meta data in this folder")
+    args = parser.parse_args()
+
+    settings = list(itertools.product(args.margins, args.min_ranges, args.max_ranges,
+                                      [value == "True" for value in args.delete_ambig]))
+    for folder in [os.path.dirname(args.summary), args.write_folder]:
+        if folder and not os.path.exists(folder):
+            print(f"{folder} directory did not exist: Created {folder}.")
+            os.makedirs(folder)
+
+    # Read the peak libraries once
+    card_peaks = np.asarray(load_peaks_txt(config.CARD_TXT))
+    pp_peaks = np.asarray(load_peaks_txt(config.PP_TXT))
+
+    print(f"Evaluating {len(settings)} settings with {args.workers} workers")
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=load_libraries,
+                                 initargs=(card_peaks, pp_peaks)) as executor:
+            rows = list(executor.map(evaluate_setting, settings,
+                                     [args.write_folder] * len(settings)))
+    else:
+        load_libraries(card_peaks, pp_peaks)
+        rows = [evaluate_setting(setting, args.write_folder) for setting in settings]
+
+    summary_df = pd.DataFrame(rows)
+    print(summary_df.to_string(index=False))
+    summary_df.to_csv(args.summary, index=False)
+    print(f"*Saved summary to {args.summary}*")
+    return
+
+
+if __name__ == "__main__":
+    main()
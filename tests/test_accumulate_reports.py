@@ -0,0 +1,78 @@
+# Standard library imports
+import filecmp
+import os
+import shutil
+
+# Import from our app
+from accumulate_reports import accumulate_reports
+from logger import Logger
+
+
+def write_report(run_path, peaks):
+    """Write a REPORT02.csv of (ret_time, area) peaks into a .D
+    directory, UTF-16 like the instrument writes them.
+    """
+    os.makedirs(run_path, exist_ok=True)
+    lines = [f"{peak_num},{ret_time},BB,0.1,{area},12.5,3.2\n"
+             for peak_num, (ret_time, area) in enumerate(peaks, start=1)]
+    with open(f"{run_path}/REPORT02.csv", "w", encoding="utf-16") as file:
+        file.write("".join(lines))
+    return
+
+
+def make_raw_input(root):
+    """Write a small RawInput tree and return its path."""
+    raw_input = f"{root}/RawInput"
+    write_report(f"{raw_input}/FolderA/001-P1-A1.D", [(1.5, 100.25), (3.25, 12.5)])
+    write_report(f"{raw_input}/FolderA/002-P1-A2.D", [(2.125, 7.0)])
+    write_report(f"{raw_input}/FolderB/001-P1-B1.D", [(4.0, 55.5)])
+    write_report(f"{raw_input}/FolderC/001-P1-C1.D", [(5.5, 1.0)])
+    os.makedirs(f"{raw_input}/FolderEmpty/001-P1-E1.D")
+    return raw_input
+
+
+def assert_same_folders(left, right):
+    """Assert two processed input folders hold the same files, byte for
+    byte.
+    """
+    assert sorted(os.listdir(left)) == sorted(os.listdir(right))
+    for filename in os.listdir(left):
+        assert filecmp.cmp(f"{left}/{filename}", f"{right}/{filename}", shallow=False), filename
+
+
+def test_incremental_run_matches_full_run(tmp_path):
+    raw_input = make_raw_input(tmp_path)
+    logger = Logger(str(tmp_path), "log.txt")
+    incremental = f"{tmp_path}/Incremental"
+    manifest_file = f"{tmp_path}/manifest.json"
+    accumulate_reports(raw_input, incremental, manifest_file, logger=logger)
+
+    # Edit one report, remove another, empty a folder, and add a run
+    write_report(f"{raw_input}/FolderA/001-P1-A1.D", [(1.5, 100.25), (3.25, 12.5), (6.0, 3.75)])
+    os.remove(f"{raw_input}/FolderA/002-P1-A2.D/REPORT02.csv")
+    shutil.rmtree(f"{raw_input}/FolderC/001-P1-C1.D")
+    write_report(f"{raw_input}/FolderB/002-P1-B2.D", [(7.25, 8.0)])
+    accumulate_reports(raw_input, incremental, manifest_file, logger=logger)
+
+    full = f"{tmp_path}/Full"
+    accumulate_reports(raw_input, full, manifest_file=None, full=True, logger=logger)
+    logger.close()
+    assert_same_folders(incremental, full)
+    assert "acc_FolderC.csv" not in os.listdir(incremental)
+
+
+def test_unchanged_run_reads_nothing_again(tmp_path, capsys):
+    raw_input = make_raw_input(tmp_path)
+    logger = Logger(str(tmp_path), "log.txt")
+    processed = f"{tmp_path}/Processed"
+    manifest_file = f"{tmp_path}/manifest.json"
+    accumulate_reports(raw_input, processed, manifest_file, logger=logger)
+    first = capsys.readouterr().out
+    # An empty folder is reported as empty the first time it is seen
+    assert first.count("Folder was empty") == 1
+    assert "Unchanged since the last run" not in first
+
+    saved = accumulate_reports(raw_input, processed, manifest_file, logger=logger)
+    assert saved == []
+    assert capsys.readouterr().out.count("Unchanged since the last run") == 4
+    logger.close()
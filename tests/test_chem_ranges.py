@@ -0,0 +1,59 @@
+# Third party imports
+import pandas as pd
+import numpy as np
+
+# Import from our app
+from chem_ranges import ChemRanges
+
+
+def make_ranges(rows):
+    """Return a ChemRanges of (ChemicalID, BeginRetTime, EndRetTime)
+    rows.
+    """
+    return ChemRanges(pd.DataFrame(rows, columns=["ChemicalID", "BeginRetTime", "EndRetTime"]))
+
+
+def linear_scan(rows, ret_time):
+    """Return the ChemicalID of the first row ret_time falls in."""
+    for chem_id, begin, end in rows:
+        if begin <= ret_time <= end:
+            return chem_id
+    return None
+
+
+def test_boundaries_are_inclusive():
+    chem_ranges = make_ranges([("A", 1.0, 2.0)])
+    assert list(chem_ranges.lookup([0.999, 1.0, 1.5, 2.0, 2.001])) == [None, "A", "A", "A", None]
+
+
+def test_first_range_wins_when_ranges_overlap():
+    chem_ranges = make_ranges([("A", 2.0, 4.0), ("B", 1.0, 5.0), ("C", 3.0, 3.5)])
+    assert list(chem_ranges.lookup([1.0, 2.0, 3.0, 3.5, 4.0, 4.5, 5.0])) == ["B", "A", "A", "A", "A", "B", "B"]
+
+
+def test_ranges_that_only_touch():
+    chem_ranges = make_ranges([("A", 1.0, 2.0), ("B", 2.0, 3.0)])
+    assert list(chem_ranges.lookup([1.5, 2.0, 2.5])) == ["A", "A", "B"]
+    chem_ranges = make_ranges([("B", 2.0, 3.0), ("A", 1.0, 2.0)])
+    assert list(chem_ranges.lookup([1.5, 2.0, 2.5])) == ["A", "B", "B"]
+
+
+def test_reversed_and_empty_ranges():
+    chem_ranges = make_ranges([("A", 3.0, 1.0), ("B", 2.0, 2.0), ("C", 1.0, 3.0)])
+    assert list(chem_ranges.lookup([1.0, 2.0, 2.5])) == ["C", "B", "C"]
+    assert list(make_ranges([("A", 3.0, 1.0)]).lookup([2.0])) == [None]
+    assert list(make_ranges([]).lookup([2.0])) == [None]
+
+
+def test_nan_ret_times_and_ranges():
+    chem_ranges = make_ranges([("A", 1.0, 2.0), ("B", np.nan, 3.0), ("C", 2.5, np.nan)])
+    assert list(chem_ranges.lookup([np.nan, 1.5, 2.5])) == [None, "A", None]
+
+
+def test_matches_linear_scan():
+    rng = np.random.default_rng(0)
+    begins = rng.integers(0, 50, 200) / 2
+    rows = [(f"C{i}", begin, begin + rng.integers(-2, 8) / 2) for i, begin in enumerate(begins)]
+    ret_times = np.concatenate([rng.integers(-4, 120, 500) / 4, rng.uniform(-1, 30, 500)])
+    expected = [linear_scan(rows, ret_time) for ret_time in ret_times]
+    assert list(make_ranges(rows).lookup(ret_times)) == expected
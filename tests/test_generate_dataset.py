@@ -0,0 +1,77 @@
+# Third party imports
+import pandas as pd
+
+# Import from our app
+from generate_dataset import generate_dataset, generate_datasets
+from logger import Logger
+
+
+def write_inputs(tmp_path):
+    """Write processed files for folders X and XNew, which list their
+    samples under the same parent directory, along with the chemical and
+    sample meta data. Return the paths of the meta data files.
+    """
+    processed = tmp_path / "ProcessedInput"
+    processed.mkdir()
+    pd.DataFrame({"FileName": ["a.D", "a.D", "b.D"], "PeakNum": [1, 2, 1],
+                  "RetTime": [1.5, 2.5, 1.6], "Area": [10.0, 20.0, 30.0]}
+                 ).to_csv(processed / "acc_X.csv", index=False)
+    pd.DataFrame({"FileName": ["a.D", "c.D"], "PeakNum": [1, 1],
+                  "RetTime": [1.4, 2.4], "Area": [40.0, 50.0]}
+                 ).to_csv(processed / "acc_XNew.csv", index=False)
+
+    chem_meta_file = tmp_path / "chemmeta.csv"
+    pd.DataFrame({"ChemicalID": ["C1", "C2"], "BeginRetTime": [1.0, 2.0],
+                  "EndRetTime": [2.0, 3.0]}).to_csv(chem_meta_file, index=False)
+    super_meta_file = tmp_path / "supermeta.csv"
+    pd.DataFrame({"FolderName": ["X", "X", "X"], "HPLCdatafilename": ["a.D", "b.D", "c.D"],
+                  "AccessionName": ["A", "B", "C"]}).to_csv(super_meta_file, index=False)
+    return str(chem_meta_file), str(super_meta_file)
+
+
+def sorted_rows(path):
+    """Return the rows of a saved dataset in a fixed order."""
+    df = pd.read_csv(path)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def test_new_folders_keep_their_own_samples(tmp_path):
+    chem_meta_file, super_meta_file = write_inputs(tmp_path)
+    logger = Logger(str(tmp_path), "log.txt")
+    paths = {}
+    for name, kwargs in [("legacy", {"engine": "legacy"}),
+                         ("vectorized", {}),
+                         ("chunked", {"chunk_size": 1})]:
+        paths[name] = generate_dataset(str(tmp_path / "ProcessedInput"), chem_meta_file,
+                                       super_meta_file, str(tmp_path / name),
+                                       logger=logger, **kwargs)
+    logger.close()
+
+    # a.D is a sample of both X and XNew, so it gets two rows
+    legacy_df = sorted_rows(paths["legacy"])
+    assert legacy_df["AccessionName"].tolist() == ["A", "A", "B", "C"]
+    assert legacy_df["C1"].fillna(-1).tolist() == [10.0, 40.0, 30.0, -1]
+    for name in ["vectorized", "chunked"]:
+        pd.testing.assert_frame_equal(sorted_rows(paths[name]), legacy_df)
+
+
+def test_batch_datasets_match_single_datasets(tmp_path):
+    chem_meta_file, super_meta_file = write_inputs(tmp_path)
+    wide_meta_file = tmp_path / "wide.csv"
+    pd.DataFrame({"ChemicalID": ["W"], "BeginRetTime": [1.0],
+                  "EndRetTime": [3.0]}).to_csv(wide_meta_file, index=False)
+    chem_meta_files = [chem_meta_file, str(wide_meta_file)]
+    logger = Logger(str(tmp_path), "log.txt")
+    chunked_paths = generate_datasets(str(tmp_path / "ProcessedInput"), chem_meta_files,
+                                      super_meta_file, str(tmp_path / "chunked"),
+                                      logger=logger, chunk_size=2, area_dtype="float32")
+    whole_paths = generate_datasets(str(tmp_path / "ProcessedInput"), chem_meta_files,
+                                    super_meta_file, str(tmp_path / "whole"),
+                                    logger=logger, area_dtype="float32")
+    for chem_meta_file, chunked_path, whole_path in zip(chem_meta_files, chunked_paths, whole_paths):
+        single_path = generate_dataset(str(tmp_path / "ProcessedInput"), chem_meta_file,
+                                       super_meta_file, str(tmp_path / "single"),
+                                       logger=logger, area_dtype="float32")
+        pd.testing.assert_frame_equal(pd.read_csv(chunked_path), pd.read_csv(single_path))
+        pd.testing.assert_frame_equal(pd.read_csv(whole_path), pd.read_csv(single_path))
+    logger.close()
@@ -0,0 +1,70 @@
+# Standard library imports
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Third party imports
+import pytest
+
+# Import from our app
+from logger import Logger
+
+
+def log_from_worker(queue_logger, worker):
+    """Log a few messages from a worker process."""
+    for i in range(3):
+        queue_logger.log(f"worker {worker} message {i}", worker=worker)
+    return
+
+
+def log_from_thread(logger, thread):
+    """Log a batch of messages from a thread."""
+    for i in range(50):
+        logger.log(f"{thread} {i}", thread=thread)
+    return
+
+
+def read_lines(path):
+    """Return the lines written to a log file."""
+    with open(path) as file:
+        return file.read().splitlines()
+
+
+def test_buffered_messages_are_written_on_close(tmp_path):
+    logger = Logger(str(tmp_path), "log.txt", erase_on_init=True, buffer_size=10)
+    logger.log("first")
+    assert read_lines(tmp_path / "log.txt") == []
+    logger.close()
+    lines = read_lines(tmp_path / "log.txt")
+    assert len(lines) == 1 and lines[0].endswith(" : first")
+
+
+def test_logging_after_close_raises(tmp_path):
+    logger = Logger(str(tmp_path), "log.txt", erase_on_init=True)
+    logger.close()
+    with pytest.raises(ValueError):
+        logger.log("too late")
+
+
+def test_threads_share_a_logger(tmp_path):
+    logger = Logger(str(tmp_path), "log.txt", erase_on_init=True, buffer_size=7, json_lines=True)
+    threads = [threading.Thread(target=log_from_thread, args=(logger, t)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.close()
+    records = [json.loads(line) for line in read_lines(tmp_path / "log.txt")]
+    assert sorted(record["msg"] for record in records) == sorted(f"{t} {i}" for t in range(4) for i in range(50))
+
+
+def test_worker_processes_log_through_a_queue(tmp_path):
+    logger = Logger(str(tmp_path), "log.txt", erase_on_init=True, json_lines=True)
+    queue_logger = logger.queue_logger()
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        list(executor.map(log_from_worker, [queue_logger] * 2, [0, 1]))
+    logger.log("main")
+    logger.close()
+    records = [json.loads(line) for line in read_lines(tmp_path / "log.txt")]
+    assert len(records) == 7
+    assert sorted(record["worker"] for record in records if "worker" in record) == [0, 0, 0, 1, 1, 1]
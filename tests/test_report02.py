@@ -0,0 +1,123 @@
+# Standard library imports
+import codecs
+import random
+
+# Third party imports
+import pandas as pd
+import numpy as np
+import pytest
+
+# Import from our app
+from report02 import check_report02, detect_encoding, parse_report02, read_report02
+
+# A line of a report, as the instrument writes it
+LINE = "1,15.677,BB,0.1,1921.4145,12.5,3.2"
+
+
+def write_bytes(tmp_path, data):
+    """Write a report's bytes to a file and return its path."""
+    path = tmp_path / "REPORT02.csv"
+    path.write_bytes(data)
+    return str(path)
+
+
+def read_the_old_way(path):
+    """Return the columns the reader before read_report02() gave."""
+    with open(path, "r", encoding="utf-16") as file:
+        return parse_report02(file.readlines(), path)
+
+
+def read_or_error(path, as_text):
+    """Return read_report02()'s columns as lists, or the ValueError it
+    raised.
+    """
+    try:
+        return [list(column) for column in read_report02(path, as_text)]
+    except ValueError as e:
+        return type(e)
+
+
+def uses_fast_path(data):
+    """Return whether read_report02() can skip parse_report02()."""
+    return check_report02(data, *detect_encoding(data)) is not None
+
+
+def test_detect_encoding():
+    text = LINE + "\n"
+    assert detect_encoding(text.encode("utf-16"))[0] in ("utf-16-le", "utf-16-be")
+    assert detect_encoding(codecs.BOM_UTF16_BE + text.encode("utf-16-be"))[:2] == ("utf-16-be", 2)
+    assert detect_encoding(text.encode("utf-16-le")) == ("utf-16-le", 0, "<u2")
+    assert detect_encoding(text.encode("utf-16-be")) == ("utf-16-be", 0, ">u2")
+    assert detect_encoding(text.encode("utf-8-sig"))[:2] == ("utf-8", 3)
+    assert detect_encoding(text.encode("utf-8")) == ("utf-8", 0, "u1")
+
+
+@pytest.mark.parametrize("encoding", ["utf-16-le", "utf-16-be", "utf-8"])
+def test_reports_without_a_byte_order_mark_are_read(tmp_path, encoding):
+    path = write_bytes(tmp_path, f"{LINE}\n2,8.29,BB,0.1,819.8133,12.5,3.2\n".encode(encoding))
+    assert read_or_error(path, True) == [["1", "2"], ["15.677", "8.29"], ["1921.4145", "819.8133"]]
+    peak_nums, ret_times, areas = read_report02(path, as_text=False)
+    assert peak_nums.tolist() == [1, 2] and areas.tolist() == [1921.4145, 819.8133]
+
+
+def test_typed_columns_match_the_text(tmp_path):
+    path = write_bytes(tmp_path, f"{LINE}\r\n2,8.29,BB,0.1,819.8133,12.5,3.2\r\n".encode("utf-16"))
+    assert uses_fast_path((tmp_path / "REPORT02.csv").read_bytes())
+    text = read_report02(path)
+    typed = read_report02(path, as_text=False)
+    for text_column, typed_column in zip(text, typed):
+        assert np.array_equal(pd.to_numeric(pd.Series(text_column)).to_numpy(), typed_column)
+
+
+@pytest.mark.parametrize("text", [
+    LINE + "\rmore,1,2,3,4,5\n",      # Stray carriage return
+    LINE + "\n1,2,3,4,5\n",           # Line with only five fields
+    LINE + "\n1,2,3\n",               # Line with too few fields
+    LINE + "\n\n",                    # Blank line
+    LINE + "\r",                      # Carriage return at the end
+])
+def test_odd_lines_fall_back_to_parse_report02(tmp_path, text):
+    data = text.encode("utf-16")
+    assert not uses_fast_path(data)
+    path = write_bytes(tmp_path, data)
+    try:
+        expected = [list(column) for column in read_the_old_way(path)]
+    except ValueError as e:
+        expected = type(e)
+    assert read_or_error(path, True) == expected
+
+
+def test_odd_byte_count_falls_back(tmp_path):
+    data = (LINE + "\n").encode("utf-16") + b"\x00"
+    assert not uses_fast_path(data)
+    path = write_bytes(tmp_path, data)
+    assert read_or_error(path, True) is UnicodeDecodeError
+    assert read_or_error(path, False) is UnicodeDecodeError
+
+
+def test_matches_the_old_reader(tmp_path):
+    rng = random.Random(0)
+    fields = ["1", "2.5", "BB", "0.1", "", " 3", '"q"', "x,y", "1e3"]
+    for _ in range(300):
+        lines = []
+        for _ in range(rng.randint(0, 6)):
+            n_fields = rng.choice([1, 4, 5, 6, 7, 7, 9])
+            ending = rng.choice(["\n", "\r\n", "\n", "", "\r"])
+            lines.append(",".join(rng.choice(fields) for _ in range(n_fields)) + ending)
+        path = write_bytes(tmp_path, "".join(lines).encode("utf-16"))
+        try:
+            expected = [list(column) for column in read_the_old_way(path)]
+        except ValueError as e:
+            expected = type(e)
+        assert read_or_error(path, True) == expected
+
+        # Numbers must match converting the old reader's text
+        try:
+            expected = [pd.to_numeric(pd.Series(column)).tolist() for column in expected]
+        except (TypeError, ValueError):
+            continue
+        got = read_or_error(path, False)
+        if not isinstance(got, type):
+            for got_column, expected_column in zip(got, expected):
+                np.testing.assert_array_equal(np.asarray(got_column, dtype=float),
+                                              np.asarray(expected_column, dtype=float))
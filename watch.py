@@ -0,0 +1,278 @@
+"""Keep the final dataset up to date while new runs are copied into
+RawInput. The raw input folder is polled every WATCH_INTERVAL seconds.
+Once a run folder's reports have stopped changing for
+WATCH_SETTLE_SECONDS, so it is known to be completely copied, only that
+folder is accumulated and only its rows of the final dataset are built
+again. The rows of every other folder are kept from when they were last
+built.
+
+The dataset is saved as finalDatasetWatch in OUTPUT_FOLDER, replaced
+each time it changes. Run from the repository root and stop with
+Ctrl+C:
+    python watch.py
+"""
+# Standard library imports
+import os
+import time
+
+# Third party imports
+import pandas as pd
+
+# Import from our app
+from accumulate_reports import accumulate_folder, save_folder
+from generate_dataset import build_dataset, load_chem_ranges, load_meta_index, save_dataset
+from instrument import instrument
+from logger import Logger
+from manifest import load_manifest, save_manifest
+from report02 import REPORT_FILENAME
+from run_pipeline import folder_peaks
+from storage import STORAGE_FORMATS, check_storage_format
+import peak_store
+import config
+
+
+def snapshot_folder(folder_path):
+    """Return the size and mtime of the report in every .D directory of
+    a run folder, or None for the directories that don't have one yet.
+    Two equal snapshots mean nothing in the folder was copied in between.
+    """
+    snapshot = []
+    for filename in sorted(os.listdir(folder_path)):
+        if filename[-2:] != ".D":
+            continue
+        try:
+            stat = os.stat(f"{folder_path}/{filename}/{REPORT_FILENAME}")
+            snapshot.append((filename, stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            snapshot.append((filename, None, None))
+    return tuple(snapshot)
+
+
+def file_mtime(path):
+    """Return the mtime of a file, or None if it doesn't exist."""
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class Watcher:
+    """Remembers which run folders have been accumulated, and the rows
+    of the final dataset built from each of them.
+    """
+    def __init__(self, raw_input_folder, processed_input_folder, chem_meta_file,
+                 super_meta_file, output_folder, logger, manifest_file=None,
+                 settle_seconds=60, storage_format="csv", peak_database=None):
+        check_storage_format(storage_format)
+        self.raw_input_folder = raw_input_folder
+        self.processed_input_folder = processed_input_folder
+        self.chem_meta_file = chem_meta_file
+        self.super_meta_file = super_meta_file
+        self.output_folder = output_folder
+        self.logger = logger
+        self.manifest_file = manifest_file
+        self.settle_seconds = settle_seconds
+        self.storage_format = storage_format
+        self.peak_database = peak_database
+        self.output_filename = f"finalDatasetWatch{STORAGE_FORMATS[storage_format]}"
+
+        for folder in [processed_input_folder, output_folder]:
+            if not os.path.exists(folder):
+                print(f"{folder} directory did not exist: Created {folder}.")
+                os.mkdir(folder)
+        if manifest_file is None:
+            self.manifest = {"folders": {}}
+        else:
+            self.manifest = load_manifest(manifest_file)
+
+        # The snapshot of each folder when it was last accumulated
+        self.done = {}
+        # The snapshot of each folder still being copied, and when it
+        # last changed
+        self.pending = {}
+        # The final dataset rows built from each folder
+        self.folder_rows = {}
+        self.meta_mtimes = None
+        # The last error reading the meta data, so it is only logged once
+        self.meta_error = None
+        return
+
+    def load_meta_data(self):
+        """Read the chemical and sample meta data files again if either
+        has changed. Return whether they were read.
+        """
+        meta_mtimes = (file_mtime(self.chem_meta_file), file_mtime(self.super_meta_file))
+        if meta_mtimes == self.meta_mtimes:
+            return False
+        self.chem_ranges, self.chem_columns = load_chem_ranges(self.chem_meta_file)
+        self.meta_index, self.meta_columns = load_meta_index(self.super_meta_file, self.logger)
+        self.meta_mtimes = meta_mtimes
+        return True
+
+    def ready_folders(self):
+        """Return the folders that have changed since they were last
+        accumulated and have since stopped changing for settle_seconds.
+        Forget the folders that were removed.
+        """
+        now = time.monotonic()
+        # Parse non-folders by excluding anything with a file extension.
+        raw_data_folders = [folder for folder in os.listdir(self.raw_input_folder)
+                            if len(folder.split(".")) == 1]
+        for folder_name in set(self.done) - set(raw_data_folders):
+            print(f"Folder {folder_name} was removed")
+            del self.done[folder_name]
+            self.folder_rows.pop(folder_name, None)
+
+        ready = []
+        for folder_name in raw_data_folders:
+            try:
+                snapshot = snapshot_folder(f"{self.raw_input_folder}/{folder_name}")
+            except FileNotFoundError:
+                continue  # Removed while it was being looked at
+            if self.done.get(folder_name) == snapshot:
+                self.pending.pop(folder_name, None)
+                continue
+            if folder_name not in self.pending or self.pending[folder_name][0] != snapshot:
+                # Still being copied, wait for it to settle
+                self.pending[folder_name] = (snapshot, now)
+            elif now - self.pending[folder_name][1] >= self.settle_seconds:
+                ready.append(folder_name)
+        return ready
+
+    def process_folder(self, folder_name):
+        """Accumulate a folder and build its rows of the final dataset."""
+        known_reports = self.manifest["folders"].get(folder_name)
+        with instrument.stage("accumulate folder", item=folder_name):
+            folder_df, entries, messages, changed = accumulate_folder(
+                self.raw_input_folder, folder_name, False, known_reports,
+                self.processed_input_folder, self.storage_format)
+        for msg in messages:
+            self.logger.log(msg)
+        if changed:
+            save_folder(folder_df, self.processed_input_folder, folder_name, self.storage_format)
+            if self.peak_database is not None:
+                conn = peak_store.connect(self.peak_database)
+                peak_store.store_folder(conn, folder_name, folder_df)
+                conn.close()
+        self.manifest["folders"][folder_name] = entries
+
+        if len(folder_df.index) > 0:
+            with instrument.stage("finalize folder", item=folder_name, rows=len(folder_df.index)):
+                peaks_df = folder_peaks(folder_df, folder_name)
+                self.folder_rows[folder_name] = build_dataset(
+                    peaks_df, self.chem_ranges, self.chem_columns,
+                    self.meta_index, self.meta_columns, self.logger)
+        else:
+            self.folder_rows.pop(folder_name, None)
+        return
+
+    def save(self):
+        """Save the final dataset made of every folder's rows, or delete
+        the saved dataset if no folder has any rows left.
+        """
+        if len(self.folder_rows) > 0:
+            output_df = pd.concat([self.folder_rows[folder_name] for folder_name in sorted(self.folder_rows)],
+                                  ignore_index=True)
+            save_dataset(output_df, self.output_folder, self.storage_format, self.output_filename)
+        else:
+            output_path = f"{self.output_folder}/{self.output_filename}"
+            if os.path.exists(output_path):
+                os.remove(output_path)
+                print(f"*No data left, removed {output_path}*")
+        if self.manifest_file is not None:
+            save_manifest(self.manifest, self.manifest_file)
+        return
+
+    def poll(self):
+        """Accumulate the folders that are ready and save the final
+        dataset if anything changed. Return the folders accumulated.
+        """
+        n_folders = len(self.folder_rows)
+        processed = []
+        try:
+            meta_changed = self.load_meta_data()
+        except (OSError, KeyError, ValueError) as e:
+            # Missing or still being written, try again next poll
+            message = f"Could not read the meta data, waiting for it to be fixed: {e}"
+            if message != self.meta_error:
+                self.logger.log(message)
+                self.logger.flush()
+                self.meta_error = message
+            return processed
+        self.meta_error = None
+        if meta_changed and self.done:
+            # Every folder's rows depend on the meta data
+            print("Meta data changed, rebuilding every folder")
+            for folder_name in sorted(self.done):
+                self.process_folder(folder_name)
+                processed.append(folder_name)
+        for folder_name in self.ready_folders():
+            print(f"Processing folder {folder_name}")
+            self.process_folder(folder_name)
+            self.done[folder_name] = self.pending.pop(folder_name)[0]
+            processed.append(folder_name)
+        if processed or len(self.folder_rows) != n_folders:
+            self.save()
+            self.logger.flush()
+        # Report this poll's stages and forget them, so they don't pile
+        # up while watching
+        if processed and instrument.enabled:
+            print(instrument.report())
+        instrument.take_stages()
+        return processed
+
+
+def watch(raw_input_folder, processed_input_folder, chem_meta_file, super_meta_file,
+          output_folder, interval=10, settle_seconds=60, manifest_file=None,
+          storage_format="csv", peak_database=None, logger=None):
+    """Poll raw_input_folder every interval seconds and keep the final
+    dataset in output_folder up to date until interrupted with Ctrl+C.
+    See Watcher for the other arguments.
+    """
+    # Log to log.txt unless the caller has a logger
+    own_logger = logger is None
+    if own_logger:
+        logger = Logger("", "log.txt")
+    if not os.path.exists(raw_input_folder):
+        raise OSError("RawInput folder not found. Please ensure it exists in your path and is named correctly.")
+
+    watcher = Watcher(raw_input_folder, processed_input_folder, chem_meta_file,
+                      super_meta_file, output_folder, logger, manifest_file,
+                      settle_seconds, storage_format, peak_database)
+    print(f"Watching {raw_input_folder} every {interval} seconds, press Ctrl+C to stop")
+    try:
+        while True:
+            watcher.poll()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    if own_logger:
+        logger.close()
+    return
+
+
+def main():
+    instrument.start()
+    # Create an object to log errors that occur
+    logger = Logger("", "log.txt", erase_on_init=False, json_lines=config.LOG_JSON_LINES)
+    try:
+        watch(config.RAW_INPUT_FOLDER,
+              config.PROCESSED_INPUT_FOLDER,
+              config.CHEM_META_FILE,
+              config.SUPER_META_FILE,
+              config.OUTPUT_FOLDER,
+              interval=config.WATCH_INTERVAL,
+              settle_seconds=config.WATCH_SETTLE_SECONDS,
+              manifest_file=config.MANIFEST_FILE,
+              storage_format=config.STORAGE_FORMAT,
+              peak_database=config.PEAK_DATABASE,
+              logger=logger)
+    except FileNotFoundError as e:
+        print(e)
+    logger.close()
+    instrument.finish()
+    return
+
+
+if __name__ == "__main__":
+    main()